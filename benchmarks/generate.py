@@ -0,0 +1,61 @@
+"""Synthetic tapes for the benchmarks: sorted inventory, price and price table files"""
+import argparse
+import os
+import random
+
+# Inventory keys are even, keys only the price file has are odd, so both files stay sorted
+KEY_FORMAT = "{:012d}"
+
+
+def inventory_key(i):
+    return KEY_FORMAT.format(2 * i)
+
+
+def write_inventory(filename, count, seed=1):
+    """Write count inventory records with ascending PRODUCT-NO"""
+    rng = random.Random(seed)
+    with open(filename, 'w') as f:
+        for i in range(count):
+            f.write(f"PRODUCT-NO: {inventory_key(i)}, QUANTITY: {rng.randrange(1000):012d}\n")
+
+
+def write_prices(filename, count, overlap=0.5, seed=2):
+    """Write a price record for each inventory key with probability overlap, and otherwise one for a key
+    the inventory lacks, so a merge against the inventory sees every kind of comparison"""
+    rng = random.Random(seed)
+    with open(filename, 'w') as f:
+        for i in range(count):
+            key = 2 * i if rng.random() < overlap else 2 * i + 1
+            f.write(f"PRODUCT-NO: {KEY_FORMAT.format(key)}, UNIT-PRICE: {rng.randrange(1, 100000):012d}\n")
+
+
+def write_price_table(filename, inventory_count, keys, seed=3):
+    """Write a small price table of keys drawn from an inventory of inventory_count records, for rescans"""
+    rng = random.Random(seed)
+    chosen = sorted(rng.sample(range(inventory_count), min(keys, inventory_count)))
+    with open(filename, 'w') as f:
+        for i in chosen:
+            f.write(f"PRODUCT-NO: {inventory_key(i)}, UNIT-PRICE: {rng.randrange(1, 100000):012d}\n")
+
+
+def generate(directory, records, overlap=0.5, table_keys=32, seed=1):
+    """Write inventory.dat, price.dat and price-table.dat into directory"""
+    os.makedirs(directory, exist_ok=True)
+    write_inventory(os.path.join(directory, "inventory.dat"), records, seed)
+    write_prices(os.path.join(directory, "price.dat"), records, overlap, seed + 1)
+    write_price_table(os.path.join(directory, "price-table.dat"), records, table_keys, seed + 2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic tapes for the FLOW-MATIC benchmarks")
+    parser.add_argument("directory", help="directory to write inventory.dat, price.dat and price-table.dat to")
+    parser.add_argument("--records", type=int, default=1000,
+                        help="records in the inventory and price files (default: %(default)s)")
+    parser.add_argument("--overlap", type=float, default=0.5,
+                        help="fraction of price records whose key is in the inventory (default: %(default)s)")
+    parser.add_argument("--table-keys", type=int, default=32,
+                        help="records in the price table the rescan benchmark reads (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed (default: %(default)s)")
+    args = parser.parse_args()
+    generate(args.directory, args.records, args.overlap, args.table_keys, args.seed)
+    print(f"Wrote {args.records} records to {args.directory}")
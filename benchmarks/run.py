@@ -0,0 +1,129 @@
+"""Run the FLOW-MATIC benchmarks and report throughput, memory and startup time as JSON"""
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from generate import generate
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+PROGRAM_DIR = os.path.join(BENCHMARK_DIR, "programs")
+DEFAULT_FLOWMATIC = os.path.join(os.path.dirname(BENCHMARK_DIR), "flowmatic.py")
+PROGRAMS = ("price", "totals", "filter", "rescan")
+REPORT_FORMAT = 1  # Bumped whenever the fields of the report change
+
+EXECUTED = re.compile(r"Executed (\d+) operations in [\d.]+ s \((\d+) ops/sec\)")
+RECORDS = re.compile(r"Read (\d+) records and wrote (\d+) records")
+
+
+def run_once(flowmatic, program, directory, extra_args):
+    """Run a program once in directory, returning its output, wall time and peak RSS in KiB"""
+    command = [sys.executable, flowmatic, program, "--pacing", "none", "--log-level", "summary"] + extra_args
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=directory, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.stdout.read().decode()
+    _, status, usage = os.wait4(process.pid, 0)
+    wall = time.perf_counter() - started
+    process.returncode = os.waitstatus_to_exitcode(status)
+    process.stdout.close()
+    if process.returncode != 0:
+        raise RuntimeError(f"{' '.join(command)} failed:\n{output}")
+    return output, wall, usage.ru_maxrss
+
+
+def measure(flowmatic, name, directory, repeat, extra_args):
+    """Run a benchmark program repeat times and keep its fastest run"""
+    program = os.path.join(PROGRAM_DIR, f"{name}.flm")
+    best = None
+    for _ in range(repeat):
+        output, wall, peak_rss = run_once(flowmatic, program, directory, extra_args)
+        executed = EXECUTED.search(output)
+        if executed is not None:
+            operations = int(executed.group(1))
+            # The printed rate comes from the unrounded time, so recover that time from it
+            seconds = operations / max(int(executed.group(2)), 1)
+        else:
+            # Older versions do not report their operations, so only the whole process can be timed
+            operations = None
+            seconds = wall
+        records = RECORDS.search(output)
+        moved = int(records.group(1)) + int(records.group(2)) if records else None
+        if best is None or seconds < best["seconds"]:
+            best = {
+                "operations": operations,
+                "records": moved,
+                "seconds": round(seconds, 6),
+                "wall_seconds": round(wall, 6),
+                "peak_rss_kib": peak_rss,
+            }
+    seconds = best["seconds"] or 1e-9
+    best["ops_per_sec"] = round(best["operations"] / seconds) if best["operations"] is not None else None
+    best["records_per_sec"] = round(best["records"] / seconds) if best["records"] is not None else None
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the FLOW-MATIC interpreter")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000],
+                        help="inventory sizes to generate, in records (default: 1000 10000)")
+    parser.add_argument("--overlap", type=float, default=0.5,
+                        help="fraction of price keys that match the inventory (default: %(default)s)")
+    parser.add_argument("--table-keys", type=int, default=32,
+                        help="price table records the rescan benchmark rescans per item (default: %(default)s)")
+    parser.add_argument("--programs", nargs="+", choices=PROGRAMS, default=list(PROGRAMS),
+                        help="benchmarks to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs of each benchmark, of which the fastest is reported (default: %(default)s)")
+    parser.add_argument("--flowmatic", default=DEFAULT_FLOWMATIC,
+                        help="flowmatic.py to benchmark, timed by wall clock if it does not report its operations "
+                             "(default: the one in this repository)")
+    parser.add_argument("--flowmatic-arg", action="append", default=[], metavar="ARG",
+                        help="extra argument for flowmatic.py, e.g. --flowmatic-arg=--compile")
+    parser.add_argument("--output", metavar="FILE", help="write the JSON report to FILE instead of stdout")
+    args = parser.parse_args()
+    flowmatic = os.path.abspath(args.flowmatic)
+
+    work = tempfile.mkdtemp(prefix="flowmatic-bench-")
+    try:
+        startup = min(run_once(flowmatic, os.path.join(PROGRAM_DIR, "startup.flm"), work, args.flowmatic_arg)[1]
+                      for _ in range(args.repeat))
+        results = []
+        for size in args.sizes:
+            directory = os.path.join(work, str(size))
+            generate(directory, size, args.overlap, args.table_keys)
+            for name in args.programs:
+                print(f"Running {name} on {size} records", file=sys.stderr)
+                result = {"benchmark": name, "size": size}
+                result.update(measure(flowmatic, name, directory, args.repeat, args.flowmatic_arg))
+                results.append(result)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    report = {
+        "format": REPORT_FORMAT,
+        "flowmatic": flowmatic,
+        "flowmatic_args": args.flowmatic_arg,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "overlap": args.overlap,
+        "table_keys": args.table_keys,
+        "repeat": args.repeat,
+        "startup_seconds": round(startup, 6),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True) + "\n"
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,1560 @@
+import argparse
+import bisect
+import contextlib
+import csv
+import hashlib
+import heapq
+import itertools
+import json
+import mmap
+import os
+import queue
 import re
+import shutil
+import struct
+import tempfile
+import threading
 import time
 import sys
+import zlib
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # No locks to count the readers of shared tape images with
+
+READ_AHEAD = 1024  # Records an input stream parses ahead of the program
+SORT_RECORDS = 100000  # Records SORT holds in memory at once; longer files are sorted in runs
+SORT_MERGE_WIDTH = 64  # Runs merged at once; more are merged into longer runs first
+FLUSH_RECORDS = 1000  # Records an output file buffers before writing them out
+FLUSH_BYTES = 1 << 20  # Bytes an output file buffers before writing them out
+PIPE_BLOCK = 256  # Records a pipeline stage passes to the next at a time
+PIPE_DEPTH = 16  # Blocks a pipe holds before the stage writing to it waits
+PIPE_WAIT = 1.0  # Seconds the stage writing to a full pipe waits before spilling to a temporary tape
+TAPE_BLOCK = 1024  # Records a UNISERVO tape unit moves at a time
+TAPE_DEPTH = 8  # Blocks a tape unit reads ahead of the program, or writes behind it
+INPUT_MODES = ("stream", "mmap", "shared")  # How input files are read
+LOG_LEVELS = ("silent", "errors", "summary", "trace")  # How much a run prints, from nothing to every step
+
+# Sidecar line index of a memory-mapped input file: magic, data file size and mtime, line count
+INDEX_HEADER = struct.Struct('<4sqqq')
+INDEX_MAGIC = b'FMIX'
+
+# Packed tape image: magic and version, then entries of payload length and schema id
+TAPE_HEADER = struct.Struct('<4sH')
+TAPE_MAGIC = b'FMTP'
+TAPE_VERSION = 1
+TAPE_ENTRY = struct.Struct('<IH')
+SCHEMA_ENTRY = 0xFFFF  # Entry defining the next schema id from its field names
+FIELD_SEPARATOR = '\x1f'  # ASCII unit separator between the packed values of a record
+
+# Shared tape image: magic and length of the tape image, then the process ids of the runs reading it
+SHARED_HEADER = struct.Struct('<4sq')
+SHARED_MAGIC = b'FMSH'
+SHARED_SLOTS = 256  # Runs a shared tape image records; more may read it, unrecorded
+SHARED_READERS = struct.Struct(f'<{SHARED_SLOTS}i')  # A free slot holds 0
+SHARED_IMAGE = SHARED_HEADER.size + SHARED_READERS.size  # Offset of the tape image
+SHARED_NAME = re.compile(r'fm[0-9a-f]{24}$')  # Names shared_tape_name gives
+SHARED_MEMORY_DIR = '/dev/shm'  # Where shared memory blocks can be listed, on Linux
+
+# Execution trace: magic and version, then a zlib stream of entries, each a varint tag and fields
+TRACE_HEADER = struct.Struct('<4sH')
+TRACE_MAGIC = b'FMTR'
+TRACE_VERSION = 1
+TRACE_OPS = 0  # The operation number of each slot
+TRACE_PATH = 1  # Defines the next path id: its length and slots
+TRACE_RUN = 2  # A path id and how many times in a row it ran
+TRACE_SCHEMA = 3  # Defines the next schema id: its field names
+TRACE_RECORD = 4  # A file letter, schema id and the values of a record read from it
+TRACE_END_OF_DATA = 5  # A file letter whose read found no more records
+TRACE_FINISH = 6  # The outcome, last operation, comparison status and step count
+TRACE_PATH_LIMIT = 256  # Steps a path may hold when no backward branch ends it
+TRACE_CHUNK = 1 << 16  # Bytes of entries collected before they are compressed
+
+
+class Log:
+    """Console output filtered by one of LOG_LEVELS
+
+    Messages take %-style arguments and are only formatted when their level
+    is shown. Hot paths test show_trace before building anything at all.
+    """
+
+    def __init__(self, level="trace", file=None):
+        self.set_level(level)
+        self.file = file  # Where messages are printed, standard output if None
+
+    def set_level(self, level):
+        rank = LOG_LEVELS.index(level)
+        self.level = level
+        self.show_errors = rank >= 1
+        self.show_summary = rank >= 2
+        self.show_trace = rank >= 3
+
+    def error(self, message, *args):
+        """Report a failure"""
+        if self.show_errors:
+            print(message % args if args else message, file=self.file)
+
+    def summary(self, message, *args):
+        """Report a file opened or closed, or how a run ended"""
+        if self.show_summary:
+            print(message % args if args else message, file=self.file)
+
+    def trace(self, message, *args):
+        """Report a single step of a run"""
+        if self.show_trace:
+            print(message % args if args else message, file=self.file)
+
+
+class Schema:
+    """The field layout shared by records: field names and the slot each is stored in"""
+    __slots__ = ('fields', 'slots', 'extensions', 'template')
+    interned = {}  # Schemas by field names, so records with one layout share one schema
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.slots = {name: slot for slot, name in enumerate(fields)}
+        self.extensions = {}  # Schemas with one more field, by that field's name
+        # Output line template, with the field names baked in
+        names = [name.replace('{', '{{').replace('}', '}}') for name in fields]
+        self.template = ', '.join(f"{name}: {{}}" for name in names) + '\n'
+
+    @classmethod
+    def of(cls, fields):
+        """Return the shared schema for a sequence of field names"""
+        fields = tuple(fields)
+        schema = cls.interned.get(fields)
+        if schema is None:
+            schema = cls.interned[fields] = cls(fields)
+        return schema
+
+    def extend(self, field_name):
+        """Return the shared schema with one more field at the end"""
+        schema = self.extensions.get(field_name)
+        if schema is None:
+            schema = self.extensions[field_name] = Schema.of(self.fields + (field_name,))
+        return schema
+
+    def __repr__(self):
+        return f"Schema{self.fields}"
+
+
+class Record:
+    """A record stored as a list of values laid out by a shared Schema
+
+    Records made by share() hold the same list of values, copy on write:
+    each takes its own copy before it is first changed.
+    """
+    __slots__ = ('schema', 'data', 'shared')
+
+    def __init__(self, schema, data, shared=False):
+        self.schema = schema
+        self.data = data  # Values in schema slot order
+        self.shared = shared  # Whether another record may hold the same list of values
+
+    @classmethod
+    def from_dict(cls, fields):
+        """Build a record from a mapping of field names to values"""
+        return cls(Schema.of(fields), list(fields.values()))
+
+    def get(self, field_name, default=None):
+        slot = self.schema.slots.get(field_name)
+        return default if slot is None else self.data[slot]
+
+    def __getitem__(self, field_name):
+        return self.data[self.schema.slots[field_name]]
+
+    def __setitem__(self, field_name, value):
+        if self.shared:
+            self.unshare()
+        slot = self.schema.slots.get(field_name)
+        if slot is None:
+            self.schema = self.schema.extend(field_name)
+            self.data.append(value)
+        else:
+            self.data[slot] = value
+
+    def __contains__(self, field_name):
+        return field_name in self.schema.slots
+
+    def __len__(self):
+        return len(self.data)
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def keys(self):
+        return self.schema.fields
+
+    def items(self):
+        return zip(self.schema.fields, self.data)
+
+    def copy(self):
+        return Record(self.schema, self.data[:])
+
+    def share(self):
+        """Return a record with the same values, without copying them until either record changes"""
+        self.shared = True
+        return Record(self.schema, self.data, True)
+
+    def unshare(self):
+        """Take a private copy of values shared with other records, before changing them"""
+        self.data = self.data[:]
+        self.shared = False
+
+    def to_dict(self):
+        return dict(zip(self.schema.fields, self.data))
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+EMPTY_SCHEMA = Schema.of(())
+
+NUMBER = re.compile(r'([+-]?)(\d*)(?:\.(\d*))?$')
+DIVIDE_SCALE = 6  # Decimal places a quotient keeps at least
+
+
+class FixedPoint:
+    """An exact decimal field value from arithmetic: an integer count of units of 10**-scale
+
+    The value remembers the zero-padded width of the text it came from and
+    is only rendered back to text when something needs it, such as
+    WRITE-ITEM. Everywhere else it behaves like that text, so comparisons
+    and TEST see the same value a text field would hold.
+    """
+    __slots__ = ('units', 'scale', 'width', 'text')
+
+    def __init__(self, units, scale=0, width=0):
+        self.units = units
+        self.scale = scale
+        self.width = width  # Digits to zero-pad the rendered text to, sign and point included
+        self.text = None  # Rendered text, once something asks for it
+
+    @classmethod
+    def parse(cls, text):
+        """Return the value of a numeric field, or None if it is not a decimal number"""
+        if text.isdecimal():
+            return cls(int(text), 0, len(text) if text[0] == '0' and len(text) > 1 else 0)
+        match = NUMBER.match(text.strip())
+        if match is None:
+            return None
+        sign, whole, fraction = match.groups()
+        fraction = fraction or ''
+        if not whole and not fraction:
+            return None
+        units = int(whole + fraction or '0')
+        padded = len(whole) > 1 and whole[0] == '0'
+        return cls(-units if sign == '-' else units, len(fraction), len(text.strip()) if padded else 0)
+
+    def rescale(self, scale):
+        """Return the units at another scale, truncating toward zero when digits are dropped"""
+        if scale >= self.scale:
+            return self.units * 10 ** (scale - self.scale)
+        units = abs(self.units) // 10 ** (self.scale - scale)
+        return -units if self.units < 0 else units
+
+    def __str__(self):
+        text = self.text
+        if text is None:
+            digits = str(abs(self.units))
+            if self.scale:
+                digits = digits.rjust(self.scale + 1, '0')
+                digits = digits[:-self.scale] + '.' + digits[-self.scale:]
+            sign = '-' if self.units < 0 else ''
+            text = self.text = sign + digits.rjust(self.width - len(sign), '0')
+        return text
+
+    def __repr__(self):
+        return f"FixedPoint({str(self)!r})"
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __eq__(self, other):
+        return str(self) == str(other)
+
+    def __lt__(self, other):
+        return str(self) < str(other)
+
+    def __le__(self, other):
+        return str(self) <= str(other)
+
+    def __gt__(self, other):
+        return str(self) > str(other)
+
+    def __ge__(self, other):
+        return str(self) >= str(other)
+
+
+def parse_record(line, filename, log):
+    """Parse a FIELD-NAME: VALUE, FIELD-NAME: VALUE line into a Record"""
+    names = []
+    values = []
+    fields = line.strip().split(', ')
+    for field in fields:
+        name, separator, value = field.partition(': ')
+        if separator:
+            names.append(name)
+            values.append(value)
+        else:
+            log.error("WARNING: Malformed field in %s: %s", filename, field)
+            
+    schema = Schema.of(names)
+    if len(schema.slots) != len(names):
+        # A repeated field name keeps its first position and its last value
+        return Record.from_dict(dict(zip(names, values)))
+    return Record(schema, values)
+
+
+class RecordLayout:
+    """A fixed-width record layout: the name, offset and width of each field
+
+    Layouts are read from a sidecar file with one FIELD-NAME OFFSET WIDTH
+    line per field, and compiled into a parser that slices the fields out
+    of each line, so records carry no field names of their own.
+    """
+
+    def __init__(self, fields):
+        self.fields = fields  # (name, offset, width) of each field
+        self.schema = Schema.of(name for name, offset, width in fields)
+        self.parse = self.compile()
+
+    @classmethod
+    def load(cls, filename):
+        """Read a layout file"""
+        fields = []
+        with open(filename) as f:
+            for number, line in enumerate(f, 1):
+                words = line.split('#', 1)[0].split()
+                if not words:
+                    continue
+                if len(words) != 3 or not words[1].isdecimal() or not words[2].isdecimal():
+                    raise ValueError(f"{filename} line {number}: expected FIELD-NAME OFFSET WIDTH")
+                fields.append((words[0], int(words[1]), int(words[2])))
+        if not fields:
+            raise ValueError(f"{filename}: no fields defined")
+        if len(set(name for name, offset, width in fields)) != len(fields):
+            raise ValueError(f"{filename}: field defined more than once")
+        return cls(tuple(fields))
+
+    def compile(self):
+        """Generate a parser that slices each field out of a line"""
+        slices = ', '.join(f"line[{offset}:{offset + width}].strip()" for name, offset, width in self.fields)
+        source = f"def parse(line):\n    return Record(schema, [{slices}])\n"
+        namespace = {"Record": Record, "schema": self.schema}
+        exec(compile(source, "<layout>", "exec"), namespace)
+        return namespace["parse"]
+
+
+class RecordStream:
+    """An input file read lazily, one bounded block of records at a time"""
+
+    def __init__(self, filename, read_ahead=READ_AHEAD, layout=None, log=None):
+        self.filename = filename
+        self.read_ahead = read_ahead
+        log = log if log is not None else Log()
+        self.parse = layout.parse if layout is not None else lambda line: parse_record(line, filename, log)
+        self.file = open(filename, 'r')
+        self.buffer = []  # Records parsed ahead of the program
+        self.position = 0  # Next record to hand out from the buffer
+
+    def read(self):
+        """Return the next record, or None at the end of the file"""
+        if self.position >= len(self.buffer) and not self.fill():
+            return None
+        record = self.buffer[self.position]
+        self.position += 1
+        return record
+
+    def fill(self):
+        """Parse the next block of lines into the read-ahead buffer"""
+        parse = self.parse
+        lines = itertools.islice(self.file, self.read_ahead)
+        self.buffer = [parse(line) for line in lines]
+        self.position = 0
+        return bool(self.buffer)
+
+    def rewind(self):
+        """Seek back to the first record"""
+        self.file.seek(0)
+        self.buffer = []
+        self.position = 0
+
+    def close(self):
+        self.file.close()
+
+
+def format_record(record):
+    """Format a record as a line of comma-separated key-value pairs"""
+    return record.schema.template.format(*record.data)
+
+
+class MappedRecordStream:
+    """An input file memory-mapped and indexed by line, so REWIND costs nothing
+
+    Line offsets are collected into an array on the first pass through the
+    file and saved next to it as <file>.idx, which later runs load instead.
+    """
+
+    def __init__(self, filename, layout=None, log=None):
+        self.filename = filename
+        log = log if log is not None else Log()
+        self.parse = layout.parse if layout is not None else lambda line: parse_record(line, filename, log)
+        self.index_name = filename + '.idx'
+        self.file = open(filename, 'rb')
+        stat = os.fstat(self.file.fileno())
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime_ns
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+        self.offsets = self.load_index()  # Line i spans offsets[i]:offsets[i + 1]
+        self.complete = self.offsets is not None
+        if self.offsets is None:
+            self.offsets = array('q', [0])
+        self.position = 0  # Next line to read
+
+    def read(self):
+        """Return the next record, or None at the end of the file"""
+        i = self.position
+        offsets = self.offsets
+        if i + 1 < len(offsets):
+            start = offsets[i]
+            end = offsets[i + 1]
+        elif self.complete:
+            return None
+        else:
+            # Still on the first pass: find the end of the next line
+            start = offsets[i]
+            if start >= self.size:
+                self.complete = True
+                self.save_index()
+                return None
+            end = self.map.find(b'\n', start) + 1 or self.size
+            offsets.append(end)
+        self.position = i + 1
+        return self.parse(self.map[start:end].decode())
+
+    def rewind(self):
+        """Go back to the first record"""
+        self.position = 0
+
+    def load_index(self):
+        """Load the sidecar line index if it matches the data file"""
+        try:
+            with open(self.index_name, 'rb') as f:
+                magic, size, mtime, count = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+                if magic != INDEX_MAGIC or size != self.size or mtime != self.mtime:
+                    return None
+                offsets = array('q')
+                offsets.fromfile(f, count)
+                return offsets
+        except (OSError, EOFError, struct.error):
+            return None
+
+    def save_index(self):
+        """Save the line index next to the data file for later runs"""
+        try:
+            with open(self.index_name + '.tmp', 'wb') as f:
+                f.write(INDEX_HEADER.pack(INDEX_MAGIC, self.size, self.mtime, len(self.offsets)))
+                self.offsets.tofile(f)
+            os.replace(self.index_name + '.tmp', self.index_name)
+        except OSError:
+            pass  # The index is only a cache
+
+    def close(self):
+        if self.size:
+            self.map.close()
+        self.file.close()
+
+
+def is_tape_image(filename):
+    """Check whether a file starts with the tape image header"""
+    with open(filename, 'rb') as f:
+        return f.read(len(TAPE_MAGIC)) == TAPE_MAGIC
+
+
+class TapeStream:
+    """A packed tape image read record by record, with no text parsing
+
+    Each entry is a payload length and a schema id. The first entry of each
+    schema defines it by its field names; records are their values joined
+    by FIELD_SEPARATOR.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, 'rb')
+        header = self.file.read(TAPE_HEADER.size)
+        if len(header) < TAPE_HEADER.size or TAPE_HEADER.unpack(header) != (TAPE_MAGIC, TAPE_VERSION):
+            self.file.close()
+            raise ValueError(f"{filename} is not a version {TAPE_VERSION} tape image")
+        self.schemas = []  # Schemas by id, in the order the tape defines them
+
+    def read(self):
+        """Return the next record, or None at the end of the tape"""
+        read = self.file.read
+        while True:
+            entry = read(TAPE_ENTRY.size)
+            if len(entry) < TAPE_ENTRY.size:
+                return None
+            length, schema_id = TAPE_ENTRY.unpack(entry)
+            payload = read(length).decode()
+            if schema_id == SCHEMA_ENTRY:
+                self.schemas.append(Schema.of(payload.split(FIELD_SEPARATOR) if payload else ()))
+                continue
+            schema = self.schemas[schema_id]
+            return Record(schema, payload.split(FIELD_SEPARATOR) if schema.fields else [])
+
+    def rewind(self):
+        """Seek back to the first entry"""
+        self.file.seek(TAPE_HEADER.size)
+        self.schemas = []
+
+    def close(self):
+        self.file.close()
+
+
+class CsvRecordStream:
+    """A CSV input file read a block of rows at a time, its field names taken from its header row"""
+
+    def __init__(self, filename, read_ahead=READ_AHEAD, log=None):
+        self.filename = filename
+        self.read_ahead = read_ahead
+        self.log = log if log is not None else Log()
+        self.file = open(filename, 'r', newline='')
+        self.rewind()
+
+    def read(self):
+        """Return the next record, or None at the end of the file"""
+        if self.position >= len(self.buffer) and not self.fill():
+            return None
+        record = self.buffer[self.position]
+        self.position += 1
+        return record
+
+    def fill(self):
+        """Parse the next block of rows into the read-ahead buffer, skipping blank lines"""
+        schema = self.schema
+        width = len(schema.fields)
+        while True:
+            rows = list(itertools.islice(self.rows, self.read_ahead))
+            self.buffer = [Record(schema, row) if len(row) == width else self.irregular(row) for row in rows if row]
+            self.position = 0
+            if self.buffer or not rows:
+                return bool(self.buffer)
+
+    def irregular(self, row):
+        """Make a record of a row with more or fewer values than the header has fields"""
+        self.log.error("WARNING: Row with %s values for %s fields in %s: %s",
+                       len(row), len(self.schema.fields), self.filename, row)
+        return Record.from_dict(dict(zip(self.schema.fields, row)))
+
+    def rewind(self):
+        """Seek back to the first row after the header"""
+        self.file.seek(0)
+        self.rows = csv.reader(self.file)
+        self.schema = Schema.of(next(self.rows, ()))
+        if len(self.schema.slots) != len(self.schema.fields):
+            raise ValueError(f"{self.filename}: field named more than once in the CSV header")
+        self.buffer = []
+        self.position = 0
+
+    def close(self):
+        self.file.close()
+
+
+class JsonLinesStream:
+    """A JSON-lines input file of one object per line, read a block of lines at a time
+
+    Values are kept as text: strings as they are, anything else as its JSON.
+    """
+
+    def __init__(self, filename, read_ahead=READ_AHEAD, log=None):
+        self.filename = filename
+        self.read_ahead = read_ahead
+        self.log = log if log is not None else Log()
+        self.decode = json.JSONDecoder().decode
+        self.file = open(filename, 'r')
+        self.buffer = []  # Records parsed ahead of the program
+        self.position = 0  # Next record to hand out from the buffer
+
+    def read(self):
+        """Return the next record, or None at the end of the file"""
+        if self.position >= len(self.buffer) and not self.fill():
+            return None
+        record = self.buffer[self.position]
+        self.position += 1
+        return record
+
+    def fill(self):
+        """Parse the next block of lines into the read-ahead buffer, skipping blank and malformed lines"""
+        while True:
+            lines = list(itertools.islice(self.file, self.read_ahead))
+            self.buffer = [record for record in map(self.parse, lines) if record is not None]
+            self.position = 0
+            if self.buffer or not lines:
+                return bool(self.buffer)
+
+    def parse(self, line):
+        """Parse one line into a record, or None if it holds none"""
+        if line.isspace():
+            return None
+        try:
+            fields = self.decode(line)
+        except ValueError as e:
+            self.log.error("WARNING: Malformed line in %s: %s", self.filename, e)
+            return None
+        if fields.__class__ is not dict:
+            self.log.error("WARNING: Line in %s is not a JSON object: %s", self.filename, line.strip())
+            return None
+        return Record(Schema.of(fields), [value if value.__class__ is str else json.dumps(value)
+                                          for value in fields.values()])
+
+    def rewind(self):
+        """Seek back to the first record"""
+        self.file.seek(0)
+        self.buffer = []
+        self.position = 0
+
+    def close(self):
+        self.file.close()
+
+
+class IndexedStream:
+    """An input file held in memory with a hash index on one field, for hash joins
+
+    Reads hand out records that share their values copy-on-write, so changes
+    a program makes to a current item are not seen by later rescans, just as
+    with a file.
+    """
+
+    def __init__(self, stream, field_name, position=0):
+        self.filename = getattr(stream, 'filename', None)
+        self.field_name = field_name
+        stream.rewind()
+        self.records = []
+        record = stream.read()
+        while record is not None:
+            self.records.append(record)
+            record = stream.read()
+        stream.close()
+        self.position = position  # Next record to read
+        # Positions of the records with each key, in file order; None if a record lacks the field
+        self.keys = {}
+        for i, record in enumerate(self.records):
+            slot = record.schema.slots.get(field_name)
+            if slot is None:
+                self.keys = None
+                break
+            self.keys.setdefault(record.data[slot], []).append(i)
+
+    def read(self):
+        """Return the next record, sharing its values with the one held in memory, or None at the end"""
+        if self.position >= len(self.records):
+            return None
+        record = self.records[self.position]
+        self.position += 1
+        return record.share()
+
+    def find(self, key, start):
+        """Return the position of the first record at or after start with a key, or None"""
+        positions = self.keys.get(key)
+        if positions is None:
+            return None
+        i = bisect.bisect_left(positions, start)
+        return positions[i] if i < len(positions) else None
+
+    def key_at(self, position):
+        """Return the key of the record at a position"""
+        record = self.records[position]
+        return record.data[record.schema.slots[self.field_name]]
+
+    def rewind(self):
+        """Go back to the first record"""
+        self.position = 0
+
+    def close(self):
+        pass
+
+
+class SortedStream:
+    """An input file sorted on some of its fields by an external merge sort
+
+    The file is sorted in runs of at most run_records records. A file that
+    fits in one run stays in memory. Otherwise each run is spilled to a
+    temporary tape image, and reads merge the runs with a heap, after
+    merging them SORT_MERGE_WIDTH at a time into longer runs while there
+    are more than that many. Records with equal keys keep their order,
+    and a record without a sort field sorts as if the field were empty.
+    """
+
+    def __init__(self, stream, fields, run_records=SORT_RECORDS):
+        self.filename = getattr(stream, 'filename', None)
+        self.fields = fields
+        self.directory = None  # Temporary directory holding the runs, once one is spilled
+        self.runs = []  # Tape images of the sorted runs
+        self.spilled = 0  # Runs written so far, naming the next
+        self.records = None  # The sorted records, when they fit in one run
+        self.streams = []
+        try:
+            stream.rewind()
+            records = iter(stream.read, None)
+            run = list(itertools.islice(records, run_records))
+            while run:
+                run.sort(key=self.key)
+                following = list(itertools.islice(records, run_records))
+                if not following and not self.runs:
+                    self.records = run
+                    break
+                self.spill(run)
+                run = following
+            self.run_count = len(self.runs)  # Runs sorted from the file, before any merging
+            while len(self.runs) > SORT_MERGE_WIDTH:
+                self.merge_runs()
+        except BaseException:
+            self.close()
+            raise
+        finally:
+            stream.close()
+        self.rewind()
+
+    def key(self, record):
+        """Return the sort key of a record: its sort field values, in order"""
+        get = record.get
+        return tuple([get(field, '') for field in self.fields])
+
+    def spill(self, run):
+        """Write a sorted run to a temporary tape image"""
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(prefix="flowmatic-sort-")
+        writer = TapeWriter(os.path.join(self.directory, f"run{self.spilled}.tape"))
+        self.spilled += 1
+        try:
+            for record in run:
+                writer.write(record)
+        finally:
+            writer.close()
+        self.runs.append(writer.filename)
+
+    def merge_runs(self):
+        """Merge the runs SORT_MERGE_WIDTH at a time into longer runs"""
+        runs = self.runs
+        self.runs = []
+        for start in range(0, len(runs), SORT_MERGE_WIDTH):
+            streams = [TapeStream(name) for name in runs[start:start + SORT_MERGE_WIDTH]]
+            try:
+                self.spill(heapq.merge(*(iter(stream.read, None) for stream in streams), key=self.key))
+            finally:
+                for stream in streams:
+                    stream.close()
+                    os.remove(stream.filename)
+
+    def read(self):
+        """Return the next record in sorted order, or None after the last"""
+        record = next(self.merged, None)
+        if record is not None and self.records is not None:
+            # Records held in memory are shared, so the program changing one leaves them intact
+            record = record.share()
+        return record
+
+    def rewind(self):
+        """Go back to the first record, restarting the merge of the runs"""
+        if self.records is not None:
+            self.merged = iter(self.records)
+            return
+        for stream in self.streams:
+            stream.close()
+        self.streams = [TapeStream(name) for name in self.runs]
+        self.merged = heapq.merge(*(iter(stream.read, None) for stream in self.streams), key=self.key)
+
+    def close(self):
+        """Close the runs and delete them"""
+        for stream in self.streams:
+            stream.close()
+        self.streams = []
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+
+class RecordWriter:
+    """An output file written incrementally through a bounded buffer
+
+    Records go to a temporary file next to the final one, which CLOSE-OUT
+    renames into place, so a finished file never appears half written.
+    """
+    binary = False  # Whether encode returns bytes rather than text
+
+    def __init__(self, filename, flush_records=FLUSH_RECORDS, flush_bytes=FLUSH_BYTES):
+        self.filename = filename
+        self.temp_name = filename + '.tmp'
+        self.flush_records = flush_records
+        self.flush_bytes = flush_bytes
+        self.file = self.open('w')
+        self.pending = []  # Encoded records not yet written
+        self.pending_bytes = 0
+        self.count = 0  # Records written since the file was opened
+
+    def open(self, mode):
+        return open(self.temp_name, mode + 'b' if self.binary else mode)
+
+    def encode(self, record):
+        """Return a record as it is stored in the file"""
+        return format_record(record)
+
+    def write(self, record):
+        """Buffer a record, writing the buffer out once it is full"""
+        if self.file is None:
+            # Written again after CLOSE-OUT: carry on from the closed file
+            os.replace(self.filename, self.temp_name)
+            self.file = self.open('a')
+        line = self.encode(record)
+        self.pending.append(line)
+        self.pending_bytes += len(line)
+        self.count += 1
+        if len(self.pending) >= self.flush_records or self.pending_bytes >= self.flush_bytes:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered records to the temporary file"""
+        if self.pending:
+            self.file.write((b'' if self.binary else '').join(self.pending))
+            self.pending = []
+            self.pending_bytes = 0
+        self.file.flush()
+
+    def close(self):
+        """Write the remaining records and move the file into place"""
+        if self.file is None:
+            return
+        self.flush()
+        self.file.close()
+        self.file = None
+        os.replace(self.temp_name, self.filename)
+
+    def abandon(self):
+        """Close the temporary file without moving it into place"""
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+
+class TapeWriter(RecordWriter):
+    """An output file written as a packed tape image"""
+    binary = True
+
+    def __init__(self, filename, flush_records=FLUSH_RECORDS, flush_bytes=FLUSH_BYTES):
+        super().__init__(filename, flush_records, flush_bytes)
+        self.file.write(TAPE_HEADER.pack(TAPE_MAGIC, TAPE_VERSION))
+        self.schema_ids = {}  # Ids of the schemas already defined on the tape
+
+    def encode(self, record):
+        """Return a record as a tape entry"""
+        return encode_tape_entry(record, self.schema_ids)
+
+
+def encode_tape_entry(record, schema_ids):
+    """Return a record as a tape entry, preceded by its schema's definition the first time schema_ids sees it"""
+    data = record.data
+    payload = FIELD_SEPARATOR.join(map(str, data)).encode()
+    if payload.count(FIELD_SEPARATOR.encode()) != max(len(data) - 1, 0):
+        raise ValueError("field value contains the tape field separator")
+    schema_id = schema_ids.get(record.schema)
+    if schema_id is not None:
+        return TAPE_ENTRY.pack(len(payload), schema_id) + payload
+    schema_id = schema_ids[record.schema] = len(schema_ids)
+    names = FIELD_SEPARATOR.join(record.schema.fields).encode()
+    return (TAPE_ENTRY.pack(len(names), SCHEMA_ENTRY) + names
+            + TAPE_ENTRY.pack(len(payload), schema_id) + payload)
+
+
+class FormattedLine:
+    """A file for csv.writer whose write returns each formatted row instead of storing it"""
+
+    def write(self, line):
+        return line
+
+
+class CsvWriter(RecordWriter):
+    """An output file written as CSV, with a header row naming the fields of its first record"""
+
+    def __init__(self, filename, flush_records=FLUSH_RECORDS, flush_bytes=FLUSH_BYTES):
+        super().__init__(filename, flush_records, flush_bytes)
+        self.format_row = csv.writer(FormattedLine(), lineterminator='\n').writerow
+        self.schema = None  # Schema of the first record, whose fields the header names
+        self.orders = {}  # Slots of the header's fields in each other schema, or None for a missing field
+
+    def encode(self, record):
+        """Return a record as a CSV row, preceded by the header row the first time"""
+        schema = record.schema
+        if schema is self.schema:
+            return self.format_row(record.data)
+        if self.schema is None:
+            self.schema = schema
+            return self.format_row(schema.fields) + self.format_row(record.data)
+        order = self.orders.get(schema)
+        if order is None:
+            extra = [name for name in schema.fields if name not in self.schema.slots]
+            if extra:
+                raise ValueError(f"fields {', '.join(extra)} are not in the CSV header")
+            order = self.orders[schema] = [schema.slots.get(name) for name in self.schema.fields]
+        data = record.data
+        return self.format_row(['' if slot is None else data[slot] for slot in order])
+
+
+class JsonLinesWriter(RecordWriter):
+    """An output file written as JSON lines, one object per record"""
+
+    def encode(self, record):
+        return json.dumps(dict(zip(record.schema.fields, record.data)), default=str) + '\n'
+
+
+class Pipe:
+    """A bounded queue of record blocks streaming one pipeline stage's output file to another's input
+
+    A None block ends the stream. The writer waits while the queue is full,
+    until the reader takes a block or stops reading. The reader may first
+    need another file the writer has yet to write, so a writer kept waiting
+    for PIPE_WAIT spills its blocks to a temporary tape instead, until the
+    reader has caught up with them.
+    """
+
+    def __init__(self, name, depth=PIPE_DEPTH):
+        self.name = name  # File name the stages write and read the records under
+        self.depth = depth
+        self.blocks = deque()  # Blocks held in memory, oldest first
+        self.spilled = deque()  # Record counts of the blocks on the spill tape, which follow those in memory
+        self.directory = None  # Temporary directory holding the spill tape, once a block is spilled
+        self.spill_writer = None
+        self.spill_reader = None
+        self.changed = threading.Condition()  # Wakes the other stage when a block is passed or taken
+        self.closed = False  # Set once the reading stage has closed the file
+        self.ended = False  # Set once the writing stage has ended the stream
+
+    def put(self, block):
+        """Pass a block to the reader, waiting for room; blocks for a reader that has stopped are dropped"""
+        with self.changed:
+            if not self.spilled:
+                while len(self.blocks) >= self.depth and not self.closed:
+                    if not self.changed.wait(PIPE_WAIT):
+                        break
+                if self.closed:
+                    return
+                if len(self.blocks) < self.depth:
+                    self.blocks.append(block)
+                    self.changed.notify_all()
+                    return
+            if not self.closed:
+                self.spill(block)
+                self.changed.notify_all()
+
+    def get(self):
+        """Take the next block, waiting for the writer"""
+        with self.changed:
+            while not self.blocks and not self.spilled:
+                self.changed.wait()
+            if self.blocks:
+                block = self.blocks.popleft()
+            else:
+                count = self.spilled.popleft()
+                block = None if count is None else [self.spill_reader.read() for _ in range(count)]
+            self.changed.notify_all()
+            return block
+
+    def spill(self, block):
+        """Add a block to the end of the spill tape"""
+        if self.spill_writer is None:
+            self.directory = tempfile.mkdtemp(prefix="flowmatic-pipe-")
+            self.spill_writer = TapeWriter(os.path.join(self.directory, f"{self.name.lower()}.tape"))
+            self.spill_writer.flush()
+            self.spill_reader = TapeStream(self.spill_writer.temp_name)
+        if block is None:
+            self.spilled.append(None)
+            return
+        for record in block:
+            self.spill_writer.write(record)
+        self.spill_writer.flush()
+        self.spilled.append(len(block))
+
+    def end(self):
+        """End the stream, once"""
+        if not self.ended:
+            self.ended = True
+            self.put(None)
+
+    def close(self):
+        """Stop reading, dropping the blocks not yet read and letting the writer run on"""
+        with self.changed:
+            self.closed = True
+            self.blocks.clear()
+            self.spilled.clear()
+            if self.directory is not None:
+                self.spill_writer.abandon()
+                self.spill_reader.close()
+                shutil.rmtree(self.directory, ignore_errors=True)
+                self.directory = None
+            self.changed.notify_all()
+
+
+class PipeStream:
+    """The input stream of a file read from a pipe"""
+
+    def __init__(self, pipe):
+        self.pipe = pipe
+        self.filename = f"pipe {pipe.name}"
+        self.block = []  # Records taken from the pipe
+        self.position = 0  # Next record to hand out from the block
+        self.ended = False  # Whether the writer has ended the stream
+
+    def read(self):
+        """Return the next record, waiting for the writing stage, or None at the end of the stream"""
+        if self.position >= len(self.block):
+            if self.ended:
+                return None
+            block = self.pipe.get()
+            if block is None:
+                self.ended = True
+                return None
+            self.block = block
+            self.position = 0
+        record = self.block[self.position]
+        self.position += 1
+        return record
+
+    def rewind(self):
+        """Stay at the start, as SORT asks before reading; once records were read there is no going back"""
+        if self.block or self.ended:
+            raise ValueError(f"{self.filename} streams from another stage and cannot be rewound")
+
+    def close(self):
+        """Stop reading, letting the writing stage run on"""
+        self.pipe.close()
+
+
+class PipeWriter:
+    """An output file streamed to the stages that read it, through a pipe to each
+
+    Records are shared copy-on-write, so neither stage sees the other change them.
+    """
+
+    def __init__(self, name, pipes):
+        self.filename = f"pipe {name}"
+        self.pipes = pipes
+        self.blocks = [[] for _ in pipes]  # Records not yet passed on, for each pipe
+        self.count = 0  # Records written
+        self.ended = False  # Whether CLOSE-OUT has ended the streams
+
+    def write(self, record):
+        """Add a record to the next block for each pipe, passing the blocks on once they are full"""
+        if self.ended:
+            raise ValueError(f"{self.filename} was closed and its readers have seen its end")
+        for block in self.blocks:
+            block.append(record.share())
+        self.count += 1
+        if len(self.blocks[0]) >= PIPE_BLOCK:
+            self.flush()
+
+    def flush(self):
+        """Pass the records collected so far on to the readers"""
+        for pipe, block in zip(self.pipes, self.blocks):
+            if block:
+                pipe.put(block)
+        self.blocks = [[] for _ in self.pipes]
+
+    def close(self):
+        """Pass on the last records and end the streams"""
+        if self.ended:
+            return
+        self.flush()
+        for pipe in self.pipes:
+            pipe.end()
+        self.ended = True
+
+    def abandon(self):
+        # A stage that stops without closing its output still ends the streams, so its readers do not wait forever
+        self.close()
+
+
+class UniservoReader:
+    """An input tape on its own UNISERVO unit: a background thread reads blocks ahead of the program
+
+    REWIND returns at once, like the real unit: it starts a new pass, which
+    the unit's thread rewinds to, and blocks read before it are dropped.
+    """
+
+    def __init__(self, stream, depth=TAPE_DEPTH):
+        self.stream = stream
+        self.filename = stream.filename
+        self.blocks = queue.Queue(depth)  # (pass, records or exception) blocks read ahead, [] at the end
+        self.changed = threading.Condition()  # Wakes the unit when a pass starts or the tape is closed
+        self.passes = 0  # Passes started by REWIND
+        self.closing = False
+        self.block = []  # Records taken from the unit
+        self.position = 0  # Next record to hand out from the block
+        self.ended = False  # Whether this pass has reached the end of the tape
+        self.thread = threading.Thread(target=self.run, name=f"UNISERVO {self.filename}", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """Read blocks ahead until the tape ends, then wait to be rewound or closed"""
+        stream = self.stream
+        current = 0
+        ended = False
+        while True:
+            with self.changed:
+                while ended and current == self.passes and not self.closing:
+                    self.changed.wait()
+                if self.closing:
+                    return
+                if current != self.passes:
+                    current = self.passes
+                    ended = False
+                    stream.rewind()
+            try:
+                block = [record for record in itertools.islice(iter(stream.read, None), TAPE_BLOCK)]
+            except Exception as e:
+                block = e
+            ended = not block or block.__class__ is not list
+            while not self.closing and current == self.passes:
+                try:
+                    self.blocks.put((current, block), timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+    def read(self):
+        """Return the next record, waiting for the unit if it has not read it yet, or None at the end"""
+        while self.position >= len(self.block):
+            if self.ended:
+                return None
+            current, block = self.blocks.get()
+            if current != self.passes:
+                continue  # Read before the last REWIND
+            if block.__class__ is not list:
+                raise block
+            self.block = block
+            self.position = 0
+            self.ended = not block
+        record = self.block[self.position]
+        self.position += 1
+        return record
+
+    def drain(self):
+        """Drop the blocks read ahead, so the unit is not left waiting for room"""
+        try:
+            while True:
+                self.blocks.get_nowait()
+        except queue.Empty:
+            pass
+
+    def rewind(self):
+        """Start a new pass from the first record, leaving the unit to rewind the tape"""
+        with self.changed:
+            self.passes += 1
+            self.changed.notify()
+        self.drain()
+        self.block = []
+        self.position = 0
+        self.ended = False
+
+    def close(self):
+        with self.changed:
+            self.closing = True
+            self.changed.notify()
+        self.drain()
+        self.thread.join()
+        self.stream.close()
+
+
+class UniservoWriter:
+    """An output tape on its own UNISERVO unit: a background thread writes blocks behind the program
+
+    Records are shared copy-on-write, so the program can change them once
+    written. A failed write is reported by the next write or CLOSE-OUT,
+    which waits for the unit to finish, and by every write after it: the
+    unit writes nothing more.
+    """
+
+    def __init__(self, writer, depth=TAPE_DEPTH):
+        self.writer = writer
+        self.filename = writer.filename
+        self.depth = depth
+        self.blocks = None  # Blocks not yet written, while the unit's thread runs
+        self.thread = None
+        self.block = []  # Records collected for the next block
+        self.count = 0  # Records written
+        self.error = None  # First failure of the unit
+
+    def run(self):
+        """Write blocks until a None block"""
+        write = self.writer.write
+        while True:
+            block = self.blocks.get()
+            if block is None:
+                return
+            if self.error is None:
+                try:
+                    for record in block:
+                        write(record)
+                except Exception as e:
+                    self.error = e
+
+    def check(self):
+        """Report a failure of the unit"""
+        if self.error is not None:
+            raise self.error
+
+    def write(self, record):
+        """Collect a record, passing a full block to the unit"""
+        self.check()
+        self.block.append(record.share())
+        self.count += 1
+        if len(self.block) >= TAPE_BLOCK:
+            if self.thread is None:
+                self.blocks = queue.Queue(self.depth)
+                self.thread = threading.Thread(target=self.run, name=f"UNISERVO {self.filename}", daemon=True)
+                self.thread.start()
+            self.blocks.put(self.block)
+            self.block = []
+
+    def finish(self):
+        """Wait for the unit to write every record collected"""
+        if self.thread is not None:
+            self.blocks.put(None)
+            self.thread.join()
+            self.thread = None
+        if self.error is None:
+            try:
+                for record in self.block:
+                    self.writer.write(record)
+            except Exception as e:
+                self.error = e
+        self.block = []
+
+    def close(self):
+        """Write the remaining records and move the file into place"""
+        self.finish()
+        self.check()
+        self.writer.close()
+
+    def abandon(self):
+        self.finish()
+        self.writer.abandon()
+
+
+def open_shared_memory(name, size=0):
+    """Create a shared memory block of size bytes, or attach to an existing one when size is 0
+
+    The block is not removed when this process exits: its readers record
+    themselves in it and the last one to close it removes it.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, size > 0, size, track=False)
+    block = shared_memory.SharedMemory(name, size > 0, size)
+    resource_tracker.unregister(block._name, "shared_memory")
+    return block
+
+
+def unlink_shared_memory(block):
+    """Remove a block opened by open_shared_memory once no more runs should attach to it
+
+    Runs still reading it keep their mapping. A block another run removed
+    first is left alone.
+    """
+    if sys.version_info < (3, 13):
+        # unlink unregisters the block from the resource tracker, which no longer knows it
+        resource_tracker.register(block._name, "shared_memory")
+    try:
+        block.unlink()
+    except FileNotFoundError:
+        if sys.version_info < (3, 13):
+            resource_tracker.unregister(block._name, "shared_memory")
+
+
+def process_alive(pid):
+    """Whether a process with this id is running"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Running as another user
+    return True
+
+
+def shared_readers(block):
+    """Return the process ids recorded in a shared tape image of the runs reading it that are still running"""
+    return [pid for pid in SHARED_READERS.unpack_from(block.buf, SHARED_HEADER.size) if pid and process_alive(pid)]
+
+
+def set_shared_readers(block, pids):
+    """Record the runs reading a shared tape image"""
+    pids = pids[:SHARED_SLOTS]
+    SHARED_READERS.pack_into(block.buf, SHARED_HEADER.size, *pids, *[0] * (SHARED_SLOTS - len(pids)))
+
+
+def remove_stale_shared_tapes():
+    """Remove the shared tape images left by runs that died, where shared memory can be listed
+
+    An image is stale once none of the runs it records is still running:
+    a killed run never gets to remove an image it was the last reader of.
+    Images still being built record the run building them.
+    """
+    try:
+        names = [name for name in os.listdir(SHARED_MEMORY_DIR) if SHARED_NAME.match(name)]
+    except OSError:
+        return
+    for name in names:
+        try:
+            block = open_shared_memory(name)
+        except (OSError, ValueError):
+            continue  # Gone, or just created and still empty
+        stale = block.size >= SHARED_IMAGE and not shared_readers(block)
+        if stale and SHARED_HEADER.unpack_from(block.buf)[0] != SHARED_MAGIC:
+            # Not built yet: only stale once the run building it has recorded itself and died
+            stale = any(SHARED_READERS.unpack_from(block.buf, SHARED_HEADER.size))
+        block.close()
+        if stale:
+            unlink_shared_memory(block)
+
+
+def shared_tape_name(filename, stat, layout_file=None):
+    """Name the shared tape image of a data file after its path, identity, size and mtime, and its layout"""
+    key = [os.path.realpath(filename), stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns]
+    if layout_file is not None:
+        layout_stat = os.stat(layout_file)
+        key += [os.path.realpath(layout_file), layout_stat.st_size, layout_stat.st_mtime_ns]
+    return "fm" + hashlib.blake2b(repr(key).encode(), digest_size=12).hexdigest()
+
+
+class SharedTapeStream:
+    """A text input file parsed once into a tape image in shared memory
+
+    Runs reading the same unchanged file at the same time attach to one
+    image instead of each parsing its own copy, and read records straight
+    out of it. The image records the process ids of its readers under a
+    lock on the data file and is removed when the last of them closes it,
+    or, if they all died, by the next run that attaches to it or builds an
+    image.
+    """
+
+    def __init__(self, filename, layout=None, layout_file=None, log=None):
+        if fcntl is None:
+            raise OSError("shared input needs file locks, which this platform lacks")
+        self.filename = filename
+        self.lock_file = open(filename, 'rb')  # Locked while the reader count changes
+        try:
+            with self.locked():
+                self.name = shared_tape_name(filename, os.fstat(self.lock_file.fileno()), layout_file)
+                self.block = self.attach()
+                self.attached = self.block is not None  # Whether another run had already parsed the file
+                if self.block is None:
+                    self.block = self.build(layout, log)
+                magic, length = SHARED_HEADER.unpack_from(self.block.buf)
+                pid = os.getpid()
+                set_shared_readers(self.block, [reader for reader in shared_readers(self.block) if reader != pid] + [pid])
+                SHARED_HEADER.pack_into(self.block.buf, 0, SHARED_MAGIC, length)
+        except BaseException:
+            self.lock_file.close()
+            raise
+        self.buffer = self.block.buf
+        self.end = SHARED_IMAGE + length
+        self.start = SHARED_IMAGE + TAPE_HEADER.size
+        self.position = self.start  # Offset of the next entry
+        self.schemas = []  # Schemas by id, in the order the tape defines them
+
+    @contextlib.contextmanager
+    def locked(self):
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+    def attach(self):
+        """Attach to the file's image if a run has already built it, else return None"""
+        try:
+            block = open_shared_memory(self.name)
+        except FileNotFoundError:
+            return None
+        if SHARED_HEADER.unpack_from(block.buf)[0] != SHARED_MAGIC:
+            # Left half built by a run that died
+            block.close()
+            unlink_shared_memory(block)
+            return None
+        return block
+
+    def build(self, layout, log):
+        """Parse the data file into a new image read by this run alone"""
+        stream = RecordStream(self.filename, layout=layout, log=log)
+        schema_ids = {}
+        entries = [TAPE_HEADER.pack(TAPE_MAGIC, TAPE_VERSION)]
+        try:
+            record = stream.read()
+            while record is not None:
+                entries.append(encode_tape_entry(record, schema_ids))
+                record = stream.read()
+        finally:
+            stream.close()
+        image = b''.join(entries)
+        remove_stale_shared_tapes()
+        block = open_shared_memory(self.name, SHARED_IMAGE + len(image))
+        set_shared_readers(block, [os.getpid()])
+        block.buf[SHARED_IMAGE:SHARED_IMAGE + len(image)] = image
+        # The caller writes the magic once the image is whole, so a run that dies here leaves none
+        SHARED_HEADER.pack_into(block.buf, 0, b'\0' * 4, len(image))
+        return block
+
+    def read(self):
+        """Return the next record, or None at the end of the tape"""
+        buffer = self.buffer
+        while True:
+            position = self.position
+            if position >= self.end:
+                return None
+            length, schema_id = TAPE_ENTRY.unpack_from(buffer, position)
+            position += TAPE_ENTRY.size
+            self.position = position + length
+            payload = str(buffer[position:self.position], 'utf-8')
+            if schema_id == SCHEMA_ENTRY:
+                self.schemas.append(Schema.of(payload.split(FIELD_SEPARATOR) if payload else ()))
+                continue
+            schema = self.schemas[schema_id]
+            return Record(schema, payload.split(FIELD_SEPARATOR) if schema.fields else [])
+
+    def rewind(self):
+        """Go back to the first entry"""
+        self.position = self.start
+        self.schemas = []
+
+    def close(self):
+        """Detach from the image, removing it if this was its last reader"""
+        if self.block is None:
+            return
+        self.buffer = None
+        with self.locked():
+            pid = os.getpid()
+            readers = [reader for reader in shared_readers(self.block) if reader != pid]
+            set_shared_readers(self.block, readers)
+            if not readers:
+                unlink_shared_memory(self.block)
+        self.block.close()
+        self.block = None
+        self.lock_file.close()
+
+
+def convert_file(source, destination, layout_file=None, log=None):
+    """Convert a data file to the codec named by the destination's extension
+
+    A destination in the source's own codec, as from text to .dat, gets a
+    tape image from text and text from a tape image.
+    """
+    file_handler = FileHandler(log)
+    if layout_file:
+        file_handler.layouts["A"] = layout_file
+    source_codec = codec_of(source)
+    codec = codec_of(destination, by_header=False)
+    if codec is source_codec:
+        codec = CODECS["text" if codec.name == "tape" else "tape"]
+    stream = source_codec.reader(file_handler, "A", source)
+    writer = codec.writer(destination)
+    try:
+        record = stream.read()
+        while record is not None:
+            writer.write(record)
+            record = stream.read()
+    except Exception:
+        writer.abandon()
+        os.remove(writer.temp_name)
+        raise
+    finally:
+        stream.close()
+    writer.close()
+    return writer.count
+
 
 class FileHandler:
-    def __init__(self):
-        self.files = {}  # Store files by their letter identifier
+    def __init__(self, log=None):
+        self.log = log if log is not None else Log()  # Where messages go
+        self.files = {}  # Input stream of each file letter, None until loaded
         self.current_items = {}  # Current item for each file
         self.output_files = {}  # Track which files are for output
         self.file_pointers = {}  # Track current position in file
         self.end_of_data = {}  # Track end of data status for each file
         self.file_names = {}  # Store the name associated with each file letter
+        self.read_ahead = READ_AHEAD  # Records each input stream buffers
+        self.sort_records = SORT_RECORDS  # Records SORT holds in memory at once
+        self.input_mode = "stream"  # One of INPUT_MODES
+        self.flush_records = FLUSH_RECORDS  # Records each output file buffers
+        self.flush_bytes = FLUSH_BYTES  # Bytes each output file buffers
+        self.records_read = 0  # Records read from every input file
+        self.records_written = 0  # Records written to every output file
+        self.recorder = None  # TraceRecorder that input reads are recorded into, if any
+        self.replay = None  # TraceReplayer that input records come from instead of files, if any
+        self.layouts = {}  # Layout file of each fixed-width input file letter
+        self.output_format = "text"  # Codec of the output files not bound to one
+        self.codecs = {}  # Codec name bound to each input or output file letter, if any
+        self.input_pipes = {}  # Pipe each INPUT file name is streamed from instead of read, in a pipeline
+        self.output_pipes = {}  # Pipes each output file name is streamed to instead of written, in a pipeline
+        self.uniservo = False  # Read and write files on UNISERVO units running alongside the program
+        self.input_directory = ''  # Directory INPUT files are read from, the current one if empty
+        self.output_directory = ''  # Directory output files are written to, the current one if empty
     
     def register_file(self, letter, file_name, is_output=False):
         """Register a file with the handler"""
-        self.files[letter] = []  # Initialize as empty list of records
+        if self.files.get(letter) is not None:
+            self.files[letter].close()
+        self.files[letter] = None  # No records until the file is loaded
         self.current_items[letter] = None
         self.file_pointers[letter] = 0
         self.end_of_data[letter] = False
         self.file_names[letter] = file_name  # Store the file name
         
         if is_output:
-            self.output_files[letter] = []
+            if self.output_files.get(letter) is not None:
+                self.output_files[letter].abandon()
+            self.output_files[letter] = None
+            if file_name in self.output_pipes:
+                self.output_files[letter] = PipeWriter(file_name, self.output_pipes[file_name])
+                return
+            codec = CODECS[self.codecs.get(letter, self.output_format)]
+            file_name = os.path.join(self.output_directory, f"{file_name.lower()}{codec.extension}")
+            try:
+                writer = codec.writer(file_name, self.flush_records, self.flush_bytes)
+                self.output_files[letter] = UniservoWriter(writer) if self.uniservo else writer
+            except Exception as e:
+                self.log.error("ERROR opening output file %s: %s", file_name, e)
     
     def read_item(self, file_letter):
-        """Read the next item from a file"""
+        """Read the next item from a file; False at the end of its data, None if it cannot be read"""
         if file_letter not in self.files:
-            print(f"ERROR: File {file_letter} not registered")
+            self.log.error("ERROR: File %s not registered", file_letter)
             return False
             
-        if self.file_pointers[file_letter] < len(self.files[file_letter]):
-            self.current_items[file_letter] = self.files[file_letter][self.file_pointers[file_letter]]
+        stream = self.files[file_letter]
+        try:
+            record = stream.read() if stream is not None else None
+        except Exception as e:
+            self.log.error("ERROR reading file %s: %s", file_letter, e)
+            return None
+        if self.recorder is not None:
+            self.recorder.record(file_letter, record)
+        if record is not None:
+            self.current_items[file_letter] = record
             self.file_pointers[file_letter] += 1
-            print(f"Read item from file {file_letter}: {self.current_items[file_letter]}")
+            self.records_read += 1
+            self.log.trace("Read item from file %s: %s", file_letter, record)
             return True
         else:
             self.end_of_data[file_letter] = True
-            print(f"End of data in file {file_letter}")
+            self.log.trace("End of data in file %s", file_letter)
             return False  # End of data
     
     def get_field(self, file_letter, field_name):
@@ -44,15 +1563,16 @@ class FileHandler:
         file_letter = file_letter.strip('()')
         
         if file_letter not in self.current_items or self.current_items[file_letter] is None:
-            print(f"ERROR: No current item for file {file_letter}")
+            self.log.error("ERROR: No current item for file %s", file_letter)
             return None
             
         item = self.current_items[file_letter]
-        if field_name not in item:
-            print(f"ERROR: Field {field_name} not in current item of file {file_letter}")
+        slot = item.schema.slots.get(field_name)
+        if slot is None:
+            self.log.error("ERROR: Field %s not in current item of file %s", field_name, file_letter)
             return None
             
-        return item[field_name]
+        return item.data[slot]
     
     def set_field(self, file_letter, field_name, value):
         """Set a field value in the current item"""
@@ -61,10 +1581,70 @@ class FileHandler:
         
         if file_letter not in self.current_items or self.current_items[file_letter] is None:
             # Create a new item if one doesn't exist
-            self.current_items[file_letter] = {}
+            self.current_items[file_letter] = Record(EMPTY_SCHEMA, [])
             
         self.current_items[file_letter][field_name] = value
     
+    def field_getter(self, file_letter, field_name):
+        """Return a function reading a field of the current item
+
+        The field's slot is looked up once per record schema rather than
+        on every access, so operations resolve field names a single time.
+        """
+        file_letter = file_letter.strip('()')
+        current_items = self.current_items
+        log = self.log
+        cached_schema = None
+        cached_slot = 0
+        
+        def get():
+            nonlocal cached_schema, cached_slot
+            item = current_items.get(file_letter)
+            if item is None:
+                log.error("ERROR: No current item for file %s", file_letter)
+                return None
+            if item.schema is not cached_schema:
+                slot = item.schema.slots.get(field_name)
+                if slot is None:
+                    log.error("ERROR: Field %s not in current item of file %s", field_name, file_letter)
+                    return None
+                cached_schema = item.schema
+                cached_slot = slot
+            return item.data[cached_slot]
+        return get
+    
+    def field_setter(self, file_letter, field_name):
+        """Return a function setting a field of the current item, resolving its slot once per schema"""
+        file_letter = file_letter.strip('()')
+        current_items = self.current_items
+        cached_schema = None
+        cached_slot = 0
+        extended_schema = None  # Schema after adding the field, when it was missing
+        
+        def put(value):
+            nonlocal cached_schema, cached_slot, extended_schema
+            item = current_items.get(file_letter)
+            if item is None:
+                # Create a new item if one doesn't exist
+                item = current_items[file_letter] = Record(EMPTY_SCHEMA, [])
+            schema = item.schema
+            if schema is not cached_schema:
+                cached_schema = schema
+                slot = schema.slots.get(field_name)
+                if slot is None:
+                    extended_schema = schema.extend(field_name)
+                else:
+                    cached_slot = slot
+                    extended_schema = None
+            if item.shared:
+                item.unshare()
+            if extended_schema is None:
+                item.data[cached_slot] = value
+            else:
+                item.schema = extended_schema
+                item.data.append(value)
+        return put
+    
     def transfer_item(self, from_letter, to_letter):
         """Copy entire record from one file to another"""
         # Remove parentheses if present
@@ -72,111 +1652,707 @@ class FileHandler:
         to_letter = to_letter.strip('()')
         
         if from_letter not in self.current_items or self.current_items[from_letter] is None:
-            print(f"ERROR: No current item for file {from_letter}")
+            self.log.error("ERROR: No current item for file %s", from_letter)
             return False
             
-        # Create a deep copy of the item
-        self.current_items[to_letter] = self.current_items[from_letter].copy()
-        print(f"Transferred item from {from_letter} to {to_letter}: {self.current_items[to_letter]}")
+        # Share the item's values; whichever file's item changes first copies them
+        self.current_items[to_letter] = self.current_items[from_letter].share()
+        self.log.trace("Transferred item from %s to %s: %s", from_letter, to_letter, self.current_items[to_letter])
         return True
     
     def write_item(self, file_letter):
         """Write the current item to an output file"""
-        if file_letter not in self.output_files:
-            print(f"ERROR: File {file_letter} not registered as output")
+        if self.output_files.get(file_letter) is None:
+            self.log.error("ERROR: File %s not registered as output", file_letter)
             return False
             
         if file_letter not in self.current_items or self.current_items[file_letter] is None:
-            print(f"ERROR: No current item for file {file_letter}")
+            self.log.error("ERROR: No current item for file %s", file_letter)
             return False
             
         # Add the current item to the output file
-        self.output_files[file_letter].append(self.current_items[file_letter].copy())
-        print(f"Wrote item to file {file_letter}: {self.current_items[file_letter]}")
+        try:
+            self.output_files[file_letter].write(self.current_items[file_letter])
+        except Exception as e:
+            self.log.error("ERROR writing to file %s: %s", file_letter, e)
+            return False
+        self.records_written += 1
+        self.log.trace("Wrote item to file %s: %s", file_letter, self.current_items[file_letter])
         return True
     
     def rewind(self, file_letter):
         """Rewind a file to the beginning"""
         if file_letter not in self.files:
-            print(f"ERROR: File {file_letter} not registered")
+            self.log.error("ERROR: File %s not registered", file_letter)
             return False
             
+        if self.files[file_letter] is not None:
+            self.files[file_letter].rewind()
+        self.file_pointers[file_letter] = 0
+        self.end_of_data[file_letter] = False
+        self.current_items[file_letter] = None
+        self.log.trace("Rewound file %s", file_letter)
+        return True
+    
+    def sort_file(self, file_letter, fields):
+        """Sort an input file on some of its fields and rewind it"""
+        if file_letter not in self.files:
+            self.log.error("ERROR: File %s not registered", file_letter)
+            return False
+            
+        # A replayed trace already holds the records in the order they were sorted into
+        stream = self.files[file_letter]
+        if stream is not None and self.replay is None:
+            try:
+                stream = self.files[file_letter] = SortedStream(stream, fields, self.sort_records)
+            except Exception as e:
+                self.files[file_letter] = None
+                self.log.error("ERROR sorting file %s: %s", file_letter, e)
+                return False
+            if stream.records is not None:
+                self.log.summary("Sorted file %s on %s in memory", file_letter, ', '.join(fields))
+            else:
+                self.log.summary("Sorted file %s on %s in %s runs", file_letter, ', '.join(fields), stream.run_count)
         self.file_pointers[file_letter] = 0
         self.end_of_data[file_letter] = False
         self.current_items[file_letter] = None
-        print(f"Rewound file {file_letter}")
         return True
     
     def close_out(self, file_letters):
-        """Close output files and finalize them by writing to disk"""
+        """Close output files, writing what is buffered and moving them into place; False if any failed"""
+        closed = True
         for letter in file_letters:
             letter = letter.strip()  # Remove any spaces from the letter
             
-            if letter in self.output_files:
-                record_count = len(self.output_files[letter])
-                print(f"Closing file {letter} with {record_count} records")
+            writer = self.output_files.get(letter)
+            if writer is not None:
+                self.log.summary("Closing file %s with %s records", letter, writer.count)
                 
-                if letter in self.file_names:
-                    # Use the file name specified in the FLOW-MATIC program
-                    file_name = f"{self.file_names[letter].lower()}.dat"
-                    
-                    try:
-                        with open(file_name, 'w') as f:
-                            for record in self.output_files[letter]:
-                                # Format each record as comma-separated key-value pairs
-                                record_str = ', '.join([f"{key}: {value}" for key, value in record.items()])
-                                f.write(record_str + '\n')
-                        print(f"Wrote output file: {file_name}")
-                    except Exception as e:
-                        print(f"ERROR writing output file {file_name}: {e}")
-                else:
-                    print(f"WARNING: No file name found for letter {letter}")
+                try:
+                    writer.close()
+                    self.log.summary("Wrote output file: %s", writer.filename)
+                except Exception as e:
+                    self.log.error("ERROR writing output file %s: %s", writer.filename, e)
+                    closed = False
+        return closed
     
+    def input_file(self, file_name, file_letter=None):
+        """Return the data file of an INPUT name: the one for the letter's codec, if bound, or else
+        the first that exists in the order codecs were registered, preferring tape images that
+        are at least as new as the file they stand in for"""
+        base = os.path.join(self.input_directory, file_name.lower())
+        if file_letter in self.codecs:
+            return base + CODECS[self.codecs[file_letter]].extension
+        found = [base + codec.extension for codec in CODECS.values() if os.path.exists(base + codec.extension)]
+        if not found:
+            return base + CODECS["text"].extension
+        tape = base + CODECS["tape"].extension
+        if found[0] == tape and len(found) > 1 and os.stat(found[1]).st_mtime_ns > os.stat(tape).st_mtime_ns:
+            self.log.error("WARNING: %s is older than %s; reading %s", tape, found[1], found[1])
+            return found[1]
+        return found[0]
+
     def load_file(self, file_letter, filename):
-        """Load data from a file"""
-        self.files[file_letter] = []
+        """Open a data file as the lazily read input stream of a file letter"""
+        if self.files.get(file_letter) is not None:
+            self.files[file_letter].close()
+        self.files[file_letter] = None
+        if self.replay is not None:
+            self.files[file_letter] = self.replay.stream(file_letter)
+            self.log.summary("Replaying %s from trace %s", filename, self.replay.filename)
+            return True
+        pipe = self.input_pipes.get(self.file_names.get(file_letter))
+        if pipe is not None:
+            self.files[file_letter] = PipeStream(pipe)
+            self.log.summary("Streaming %s from the stage writing it", pipe.name)
+            return True
         try:
-            with open(filename, 'r') as f:
-                for line in f:
-                    # Parse line into a dictionary of fields
-                    record = {}
-                    fields = line.strip().split(', ')
-                    for field in fields:
-                        if ': ' in field:
-                            name, value = field.split(': ', 1)
-                            record[name] = value
-                        else:
-                            print(f"WARNING: Malformed field in {filename}: {field}")
-                    
-                    # Add record to the file
-                    self.files[file_letter].append(record)
-            
-            print(f"Loaded {len(self.files[file_letter])} records from {filename}")
+            # A tape image is known by its header, whatever its name or the letter's codec
+            if is_tape_image(filename):
+                codec = CODECS["tape"]
+            elif file_letter in self.codecs:
+                codec = CODECS[self.codecs[file_letter]]
+            else:
+                codec = codec_of(filename)
+            stream = codec.reader(self, file_letter, filename)
+            self.files[file_letter] = UniservoReader(stream) if self.uniservo else stream
             return True
         except Exception as e:
-            print(f"ERROR loading file {filename}: {e}")
+            self.log.error("ERROR loading file %s: %s", filename, e)
             return True
 
+    def open_text(self, file_letter, filename):
+        """Open a key-value or fixed-width text data file, read as the input mode says"""
+        # A layout given for the letter, or a <name>.layout next to the data file
+        layout_file = self.layouts.get(file_letter) or os.path.splitext(filename)[0] + '.layout'
+        layout = None
+        if file_letter in self.layouts or os.path.exists(layout_file):
+            layout = RecordLayout.load(layout_file)
+        if self.input_mode == "shared":
+            stream = SharedTapeStream(filename, layout, layout_file if layout is not None else None, self.log)
+            self.log.summary("%s %s in shared memory", "Attached to" if stream.attached else "Parsed", filename)
+        elif self.input_mode == "mmap":
+            stream = MappedRecordStream(filename, layout, self.log)
+        else:
+            stream = RecordStream(filename, self.read_ahead, layout, self.log)
+        if layout is not None:
+            self.log.summary("Opened %s for reading with layout %s", filename, layout_file)
+        else:
+            self.log.summary("Opened %s for reading", filename)
+        return stream
+
+    def open_tape(self, file_letter, filename):
+        """Open a tape image"""
+        stream = TapeStream(filename)
+        self.log.summary("Opened tape image %s for reading", filename)
+        return stream
+
+    def open_csv(self, file_letter, filename):
+        """Open a CSV file with a header row"""
+        stream = CsvRecordStream(filename, self.read_ahead, self.log)
+        self.log.summary("Opened CSV file %s for reading", filename)
+        return stream
+
+    def open_json_lines(self, file_letter, filename):
+        """Open a JSON-lines file"""
+        stream = JsonLinesStream(filename, self.read_ahead, self.log)
+        self.log.summary("Opened JSON-lines file %s for reading", filename)
+        return stream
+
+    def close_files(self):
+        """Close every open file; output files not closed out stay in their temporary files"""
+        for letter, stream in self.files.items():
+            if stream is not None:
+                stream.close()
+                self.files[letter] = None
+        for writer in self.output_files.values():
+            if writer is not None:
+                writer.abandon()
+
+
+class Codec:
+    """A way of storing records in files: the extension of its files and how to read and write them"""
+
+    def __init__(self, name, extension, reader, writer):
+        self.name = name
+        self.extension = extension
+        self.reader = reader  # reader(file_handler, file_letter, filename) opens an input stream
+        self.writer = writer  # RecordWriter class that writes output files
+
+
+CODECS = {}  # Codecs by name, in the order INPUT looks for their files
+
+
+def register_codec(name, extension, reader, writer):
+    """Make a codec available to bind file letters to and write output files with"""
+    CODECS[name] = Codec(name, extension, reader, writer)
+
+
+register_codec("tape", ".tape", FileHandler.open_tape, TapeWriter)
+register_codec("text", ".dat", FileHandler.open_text, RecordWriter)
+register_codec("csv", ".csv", FileHandler.open_csv, CsvWriter)
+register_codec("jsonl", ".jsonl", FileHandler.open_json_lines, JsonLinesWriter)
+
+
+def codec_of(filename, by_header=True):
+    """Return the codec of a data file: a tape image by its header, any other file by its extension"""
+    if by_header and is_tape_image(filename):
+        return CODECS["tape"]
+    extension = os.path.splitext(filename)[1].lower()
+    for codec in CODECS.values():
+        if codec.extension == extension:
+            return codec
+    return CODECS["text"]
+
+
+class Instruction:
+    """A FLOW-MATIC command parsed once into its executable form"""
+    __slots__ = ('number', 'opcode', 'text', 'files', 'fields', 'constant', 'targets', 'clauses', 'error')
+
+    def __init__(self, opcode, text, files=(), fields=(), constant=None, targets=None, error=None):
+        self.number = None  # Operation number this command belongs to
+        self.opcode = opcode
+        self.text = text  # Source text, kept for diagnostics
+        self.files = files  # File letters of the operands, in source order
+        self.fields = fields  # Field names of the operands, in source order
+        self.constant = constant  # Literal operand (TEST value, SET operations, file names)
+        self.targets = targets if targets is not None else {}  # Branch targets keyed by condition
+        self.clauses = ()  # Trailing clauses of the operation (e.g. IF END OF DATA ...)
+        self.error = error  # Syntax error reported when the command is executed
+
+    def __repr__(self):
+        return f"Instruction(({self.number}) {self.text})"
+
+
+# Patterns used to take operations apart at parse time
+OPERATION_NUMBER = re.compile(r'^\(\d+\)$')
+GO_TO = re.compile(r'GO TO OPERATION (\d+)')
+BRANCH_PATTERNS = {
+    "GREATER": re.compile(r'IF GREATER GO TO OPERATION (\d+)'),
+    "EQUAL": re.compile(r'IF EQUAL GO TO OPERATION (\d+)'),
+    "LESS": re.compile(r'IF LESS GO TO OPERATION (\d+)'),
+    "OTHERWISE": re.compile(r'OTHERWISE GO TO OPERATION (\d+)'),
+    "END OF DATA": re.compile(r'IF END OF DATA GO TO OPERATION (\d+)'),
+}
+COMMAND_PATTERNS = {
+    "COMPARE": re.compile(r'COMPARE (\S+) \((\w+)\) WITH (\S+) \((\w+)\)'),
+    "READ-ITEM": re.compile(r'READ-ITEM (\w+)'),
+    "WRITE-ITEM": re.compile(r'WRITE-ITEM (\w+)'),
+    "TRANSFER": re.compile(r'TRANSFER (\w+) TO (\w+)'),
+    "MOVE": re.compile(r'MOVE (\S+) \((\w+)\) TO (\S+) \((\w+)\)'),
+    "JUMP": re.compile(r'JUMP TO OPERATION (\d+)'),
+    "TEST": re.compile(r'TEST (\S+) \((\w+)\) AGAINST (\S+)'),
+    "SET": re.compile(r'SET OPERATION (\d+) TO GO TO OPERATION (\d+)'),
+    "REWIND": re.compile(r'REWIND (\w+)'),
+    "SORT": re.compile(r'SORT (\w+) ON ([\w ,-]+)'),
+    "CLOSE-OUT": re.compile(r'CLOSE-OUT FILES? ([\w ,]+)'),
+    "ADD": re.compile(r'ADD (\S+) \((\w+)\) TO (\S+) \((\w+)\)'),
+    "SUBTRACT": re.compile(r'SUBTRACT (\S+) \((\w+)\) FROM (\S+) \((\w+)\)'),
+    "MULTIPLY": re.compile(r'MULTIPLY (\S+) \((\w+)\) BY (\S+) \((\w+)\) GIVING (\S+) \((\w+)\)'),
+    "DIVIDE": re.compile(r'DIVIDE (\S+) \((\w+)\) BY (\S+) \((\w+)\) GIVING (\S+) \((\w+)\)'),
+}
+
+
+# Sentinel values bound operations return in place of the next operation slot
+HALT = -1  # STOP was executed
+FAULT = -2  # A command failed and the error has been reported
+END_OF_PROGRAM = -3  # Fell through the last operation
+NO_NEXT_OPERATION = -4  # Fell through an operation without a pointer
+
+# Pacing modes: run at full speed, sleep like the real machine, or charge a simulated clock
+PACING_MODES = ("none", "realtime", "virtual")
+REALTIME_DELAY = 0.01  # VERY rough estimation of UNIVAC II speeds, in seconds per operation
+MAX_BLOCK = 16  # Operations fused into one superinstruction at most
+BATCH_OPCODES = ("TRANSFER", "MOVE", "ADD", "SUBTRACT", "MULTIPLY", "DIVIDE", "WRITE-ITEM")  # Batchable loop bodies
+
+# Simulated UNIVAC II cost of each command in microseconds; tape handling dominates
+UNIVAC_COSTS = {
+    "INPUT": 50000,
+    "OUTPUT": 50000,
+    "READ-ITEM": 6000,
+    "WRITE-ITEM": 6000,
+    "REWIND": 100000,
+    "SORT": 1000000,
+    "CLOSE-OUT": 100000,
+    "TRANSFER": 1200,
+    "MOVE": 600,
+    "COMPARE": 800,
+    "TEST": 600,
+    "JUMP": 200,
+    "SET": 200,
+    "IF": 200,
+    "ADD": 800,
+    "SUBTRACT": 800,
+    "MULTIPLY": 2400,
+    "DIVIDE": 4800,
+}
+
+
+class Profiler:
+    """Per-operation counts, wall time and records moved, plus branch edge counts
+
+    Filled in by FlowmaticInterpreter.execute when set as its profiler;
+    lists are indexed by operation slot like the dispatch array.
+    """
 
-class FlowmaticInterpreter:
     def __init__(self):
-        self.operations = {}
+        self.names = []  # Operation number of each slot
+        self.texts = []  # Text of the operation in each slot
+        self.counts = []  # Times each operation ran
+        self.times = []  # Wall time spent in each operation, in seconds
+        self.reads = []  # Records each operation read
+        self.writes = []  # Records each operation wrote
+        self.edges = {}  # Transfers of control by (from slot, to slot)
+        self.rewired = set()  # Edges taken through a successor rewritten by SET
+        self.steps = 0
+        self.elapsed = 0.0
+
+    def start(self, interpreter):
+        """Size the counters for the interpreter's bound program"""
+        self.names = list(interpreter.op_names)
+        self.texts = [interpreter.operations[op_num].text if op_num in interpreter.operations else "(missing)"
+                      for op_num in self.names]
+        size = len(self.names)
+        self.counts = [0] * size
+        self.times = [0.0] * size
+        self.reads = [0] * size
+        self.writes = [0] * size
+        self.edges = {}
+        self.rewired = set()
+
+    def operations(self):
+        """Profiled operations, most expensive first"""
+        slots = [slot for slot, count in enumerate(self.counts) if count]
+        return sorted(slots, key=lambda slot: (-self.times[slot], -self.counts[slot]))
+
+    def report(self, log, limit=20):
+        """Print the hottest operations and branch edges"""
+        total = sum(self.times) or 1.0
+        log.summary("Profile: %s operations in %.3f s", self.steps, self.elapsed)
+        log.summary("%8s %10s %10s %6s %8s %8s  %s", "OP", "COUNT", "TIME ms", "TIME%", "READ", "WRITTEN", "TEXT")
+        for slot in self.operations()[:limit]:
+            log.summary("%8s %10d %10.3f %6.1f %8d %8d  %s", f"({self.names[slot]})", self.counts[slot],
+                        self.times[slot] * 1000, 100 * self.times[slot] / total,
+                        self.reads[slot], self.writes[slot], self.texts[slot])
+        edges = sorted(self.edges.items(), key=lambda item: -item[1])[:limit]
+        if edges:
+            log.summary("Hottest branch edges:")
+        for (from_slot, to_slot), count in edges:
+            log.summary("%10d  %s -> %s%s", count, self.names[from_slot], self.names[to_slot],
+                        "  (set)" if (from_slot, to_slot) in self.rewired else "")
+
+    def to_json(self):
+        """Return the profile as plain data"""
+        return {
+            "steps": self.steps,
+            "elapsed": self.elapsed,
+            "operations": [
+                {"op": self.names[slot], "text": self.texts[slot], "count": self.counts[slot],
+                 "time": self.times[slot], "read": self.reads[slot], "written": self.writes[slot]}
+                for slot in self.operations()
+            ],
+            "edges": [
+                {"from": self.names[from_slot], "to": self.names[to_slot], "count": count,
+                 "set": (from_slot, to_slot) in self.rewired}
+                for (from_slot, to_slot), count in sorted(self.edges.items(), key=lambda item: -item[1])
+            ],
+        }
+
+    def save(self, json_file, folded_file, program_name="program"):
+        """Write the profile as JSON and as collapsed stacks weighted by microseconds"""
+        with open(json_file, 'w') as f:
+            json.dump(self.to_json(), f, indent=2)
+        with open(folded_file, 'w') as f:
+            for slot in self.operations():
+                opcode = self.texts[slot].split(' ', 1)[0]
+                f.write(f"{program_name};({self.names[slot]}) {opcode} {round(self.times[slot] * 1000000)}\n")
+
+
+def put_varint(out, value):
+    """Append an unsigned integer to a bytearray, seven bits per byte"""
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def put_text(out, text):
+    """Append a length-prefixed string to a bytearray"""
+    data = text.encode()
+    put_varint(out, len(data))
+    out += data
+
+
+class TraceRecorder:
+    """Writes a compact trace of a run: the operations executed, the records read and how it ended
+
+    Steps are grouped into paths, each ending where control goes back to an
+    earlier operation, and repeats of a path are run-length encoded, so a
+    tight loop costs a few bytes however often it goes round.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, 'wb')
+        self.file.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION))
+        self.compressor = zlib.compressobj()
+        self.out = bytearray()  # Entries not yet compressed
+        self.paths = {}  # Path ids by their slots
+        self.path = []  # Slots of the path running now
+        self.run_path = None  # Path repeating at the moment
+        self.run_count = 0  # Times it has repeated
+        self.schema_ids = {}  # Ids of the schemas already defined in the trace
+
+    def start(self, op_names):
+        """Record the operation number of each slot"""
+        put_varint(self.out, TRACE_OPS)
+        put_varint(self.out, len(op_names))
+        for op_num in op_names:
+            put_text(self.out, op_num)
+
+    def step(self, slot):
+        """Record that an operation is about to run"""
+        path = self.path
+        if path and (slot <= path[-1] or len(path) >= TRACE_PATH_LIMIT):
+            self.end_path()
+        path.append(slot)
+
+    def end_path(self):
+        """Close the running path, extending the current run when it repeats"""
+        slots = tuple(self.path)
+        self.path.clear()
+        path_id = self.paths.get(slots)
+        if path_id is None:
+            path_id = self.paths[slots] = len(self.paths)
+            put_varint(self.out, TRACE_PATH)
+            put_varint(self.out, len(slots))
+            for slot in slots:
+                put_varint(self.out, slot)
+        if path_id == self.run_path:
+            self.run_count += 1
+        else:
+            self.end_run()
+            self.run_path = path_id
+            self.run_count = 1
+
+    def end_run(self):
+        """Write the run of the repeating path"""
+        if self.run_count:
+            put_varint(self.out, TRACE_RUN)
+            put_varint(self.out, self.run_path)
+            put_varint(self.out, self.run_count)
+            self.run_count = 0
+            self.compress()
+
+    def record(self, file_letter, record):
+        """Record what a read from a file returned"""
+        out = self.out
+        if record is None:
+            put_varint(out, TRACE_END_OF_DATA)
+            put_text(out, file_letter)
+            return
+        schema_id = self.schema_ids.get(record.schema)
+        if schema_id is None:
+            schema_id = self.schema_ids[record.schema] = len(self.schema_ids)
+            put_varint(out, TRACE_SCHEMA)
+            put_text(out, FIELD_SEPARATOR.join(record.schema.fields))
+        put_varint(out, TRACE_RECORD)
+        put_text(out, file_letter)
+        put_varint(out, schema_id)
+        put_text(out, FIELD_SEPARATOR.join(map(str, record.data)))
+        self.compress()
+
+    def compress(self, force=False):
+        """Compress the collected entries into the file once there are enough of them"""
+        if self.out and (force or len(self.out) >= TRACE_CHUNK):
+            self.file.write(self.compressor.compress(bytes(self.out)))
+            self.out.clear()
+
+    def finish(self, outcome, last_op, compare_status, steps):
+        """Record how the run ended and close the trace"""
+        if self.path:
+            self.end_path()
+        self.end_run()
+        put_varint(self.out, TRACE_FINISH)
+        put_varint(self.out, -outcome)
+        put_text(self.out, last_op)
+        put_text(self.out, compare_status)
+        put_varint(self.out, steps)
+        self.compress(force=True)
+        self.file.write(self.compressor.flush())
+        self.file.close()
+
+
+class TraceReplayer:
+    """Replays a trace: feeds the recorded records to the program and checks it takes the recorded steps
+
+    The first step that differs from the trace is kept in divergence, and
+    stops the run.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, 'rb')
+        header = self.file.read(TRACE_HEADER.size)
+        if len(header) < TRACE_HEADER.size or TRACE_HEADER.unpack(header) != (TRACE_MAGIC, TRACE_VERSION):
+            self.file.close()
+            raise ValueError(f"{filename} is not a version {TRACE_VERSION} trace")
+        self.decompressor = zlib.decompressobj()
+        self.ended = False  # Whether the whole trace has been decompressed
+        self.data = b''  # Decompressed entries
+        self.position = 0  # Next byte of data to decode
+        self.op_names = []  # Operation number of each slot of the recorded program
+        self.paths = []  # Operation numbers of each path, by id
+        self.schemas = []  # Schemas by id
+        self.records = deque()  # (file letter, record or None) read but not yet delivered
+        self.runs = deque()  # [path, repeats left] not yet replayed
+        self.path = ()  # Path being replayed
+        self.index = 0  # Next step of that path
+        self.finish = None  # (outcome, last operation, comparison status, steps) once reached
+        self.steps = 0  # Steps replayed
+        self.divergence = None  # How the replay first departed from the trace
+
+    def fill(self):
+        """Decompress more of the trace, returning False at its end"""
+        if self.ended:
+            return False
+        chunk = self.file.read(TRACE_CHUNK)
+        if chunk:
+            more = self.decompressor.decompress(chunk)
+        else:
+            more = self.decompressor.flush()
+            self.ended = True
+        self.data = self.data[self.position:] + more
+        self.position = 0
+        return True
+
+    def byte(self):
+        """Return the next decompressed byte, or None at the end of the trace"""
+        while self.position >= len(self.data):
+            if not self.fill():
+                return None
+        value = self.data[self.position]
+        self.position += 1
+        return value
+
+    def take(self, size):
+        """Return the next size decompressed bytes"""
+        while len(self.data) - self.position < size:
+            if not self.fill():
+                raise ValueError(f"{self.filename} is truncated")
+        start = self.position
+        self.position = start + size
+        return self.data[start:self.position]
+
+    def varint(self):
+        value = 0
+        shift = 0
+        while True:
+            byte = self.byte()
+            if byte is None:
+                raise ValueError(f"{self.filename} is truncated")
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    def text(self):
+        return self.take(self.varint()).decode()
+
+    def entry(self):
+        """Decode the next entry into the queues, returning False at the end of the trace"""
+        tag = self.byte()
+        if tag is None:
+            return False
+        if tag == TRACE_OPS:
+            self.op_names = [self.text() for _ in range(self.varint())]
+        elif tag == TRACE_PATH:
+            self.paths.append(tuple(self.op_names[self.varint()] for _ in range(self.varint())))
+        elif tag == TRACE_RUN:
+            path = self.paths[self.varint()]
+            self.runs.append([path, self.varint()])
+        elif tag == TRACE_SCHEMA:
+            fields = self.text()
+            self.schemas.append(Schema.of(fields.split(FIELD_SEPARATOR) if fields else ()))
+        elif tag == TRACE_RECORD:
+            file_letter = self.text()
+            schema = self.schemas[self.varint()]
+            values = self.text()
+            self.records.append((file_letter, Record(schema, values.split(FIELD_SEPARATOR) if schema.fields else [])))
+        elif tag == TRACE_END_OF_DATA:
+            self.records.append((self.text(), None))
+        elif tag == TRACE_FINISH:
+            self.finish = (-self.varint(), self.text(), self.text(), self.varint())
+        else:
+            raise ValueError(f"{self.filename} has an unknown entry {tag}")
+        return True
+
+    def read(self, file_letter):
+        """Return the record the recorded run got from its next read of a file"""
+        while not self.records:
+            if not self.entry():
+                self.diverge(f"file {file_letter} read more records than the recorded run")
+                return None
+        recorded_letter, record = self.records.popleft()
+        if recorded_letter != file_letter:
+            self.diverge(f"file {file_letter} was read where the recorded run read file {recorded_letter}")
+            return None
+        return record
+
+    def step(self, op_num):
+        """Check the next operation against the trace, returning False once the replay has diverged"""
+        if self.divergence is not None:
+            return False
+        if self.index >= len(self.path):
+            while not self.runs:
+                if not self.entry():
+                    self.diverge(f"operation {op_num} ran after the recorded run stopped")
+                    return False
+            run = self.runs[0]
+            self.path = run[0]
+            self.index = 0
+            run[1] -= 1
+            if not run[1]:
+                self.runs.popleft()
+        expected = self.path[self.index]
+        if op_num != expected:
+            self.diverge(f"operation {op_num} ran where the recorded run ran operation {expected}")
+            return False
+        self.index += 1
+        self.steps += 1
+        return True
+
+    def diverge(self, message):
+        if self.divergence is None:
+            self.divergence = f"Replay diverged at step {self.steps + 1}: {message}"
+
+    def check_finish(self, outcome, last_op, compare_status, steps):
+        """Compare how the replay ended with the trace, returning the first difference or None"""
+        while self.finish is None and self.divergence is None:
+            if not self.entry():
+                self.diverge("the trace has no record of how the run ended")
+        if self.divergence is None and (outcome, last_op, compare_status, steps) != self.finish:
+            recorded_outcome, recorded_op, recorded_status, recorded_steps = self.finish
+            self.diverge(f"the replay ended after operation {last_op} with status {compare_status} "
+                         f"in {steps} steps, the recorded run after operation {recorded_op} "
+                         f"with status {recorded_status} in {recorded_steps} steps")
+        return self.divergence
+
+    def stream(self, file_letter):
+        """Return an input stream delivering the records the recorded run read from a file"""
+        return ReplayStream(self, file_letter)
+
+    def close(self):
+        self.file.close()
+
+
+class ReplayStream:
+    """An input stream fed from a trace instead of a file; REWIND is already part of the trace"""
+
+    def __init__(self, replayer, file_letter):
+        self.replayer = replayer
+        self.file_letter = file_letter
+
+    def read(self):
+        return self.replayer.read(self.file_letter)
+
+    def rewind(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FlowmaticInterpreter:
+    def __init__(self, log=None):
+        self.log = log if log is not None else Log()  # Where messages go, and how many
+        self.operations = {}  # Map from operation number to its parsed Instruction
         self.operation_pointers = {}  # Map from operation number to target operation number
         self.current_operation_number = "0"
-        self.file_handler = FileHandler()
+        self.file_handler = FileHandler(self.log)
         self.working_storage = {}  # W-storage for temporary values
         self.compare_status = "EQUAL"  # Result of the last comparison
         self.running = True
-        self.debug = True  # Enable/disable debug output
-        
-    def debug_print(self, message):
-        """Print debug messages if debugging is enabled"""
-        if self.debug:
-            print(message)
+        self.code = []  # Bound operation handlers, indexed by operation slot
+        self.successors = []  # Fall-through slot of each operation, mirrors operation_pointers
+        self.op_index = {}  # Map from operation number to its slot
+        self.op_names = []  # Operation number held by each slot
+        self.steps_executed = 0  # Operations executed by the last run
+        self.elapsed_time = 0.0  # Wall time of the last run in seconds
+        self.pacing = "realtime"  # One of PACING_MODES
+        self.op_costs = []  # Simulated cost of each operation slot in microseconds
+        self.simulated_time = 0.0  # Simulated UNIVAC II time of the last run in seconds
+        self.profiler = None  # Profiler that execute fills in, if any
+        self.recorder = None  # TraceRecorder that execute writes the run to, if any
+        self.replay = None  # TraceReplayer that execute follows instead of reading input files, if any
+        self.superinstructions = True  # Fuse straight-line runs of operations when running at full speed
+        self.batching = True  # Run read-transform-write loops as batches when running at full speed
+        self.hash_joins = False  # Answer rewind-and-rescan lookups from an in-memory hash index
+        self.fused_through = {}  # Heads of the fused blocks running through each slot, for SET to rebuild
         
     def is_operation_number(self, token):
         """Check if a token is an operation number"""
-        return bool(re.match(r'^\(\d+\)$', token))
+        return bool(OPERATION_NUMBER.match(token))
 
     def parse_program(self, program_text):
         """Parse a complete FLOW-MATIC program"""
@@ -203,17 +2379,29 @@ class FlowmaticInterpreter:
             return None
             
         if "." not in line:
-            print(f"SYNTAX ERROR - END NOT IN LINE: {line}")
+            self.log.error("SYNTAX ERROR - END NOT IN LINE: %s", line)
             return None
             
         if not self.is_operation_number(tokens[0]):
-            print(f"SYNTAX ERROR - LINE MUST BEGIN WITH OPERATION NUMBER: {line}")
+            self.log.error("SYNTAX ERROR - LINE MUST BEGIN WITH OPERATION NUMBER: %s", line)
             return None
             
         op_num = tokens[0].strip('()')
-        self.operations[op_num] = tokens[1:]
+        self.operations[op_num] = self.parse_operation(op_num, tokens[1:])
         return True
 
+    def parse_operation(self, op_num, tokens):
+        """Parse the tokens of one operation into a single Instruction"""
+        commands = [self.parse_command(command) for command in self.extract_commands(tokens)]
+        if not commands:
+            commands = [Instruction("NOP", "")]
+            
+        instruction = commands[0]
+        instruction.clauses = tuple(commands[1:])
+        for command in commands:
+            command.number = op_num
+        return instruction
+
     def extract_commands(self, tokens):
         """Extract primary commands from tokenized operation"""
         # In FLOW-MATIC, semicolons separate the main command from conditional parts
@@ -240,648 +2428,2210 @@ class FlowmaticInterpreter:
         for part in parts:
             part = part.strip()
             if part:  # Skip empty parts
-                # Check if this is a standalone IF or OTHERWISE - these should be kept separate
-                if part.startswith('IF') or part.startswith('OTHERWISE'):
-                    commands.append(part)
-                else:
-                    commands.append(part)
+                commands.append(part)
         
         return commands
 
+    def parse_command(self, command):
+        """Parse a single FLOW-MATIC command into an Instruction"""
+        words = command.split()
+        opcode = words[0]
+        
+        if opcode == "INPUT" or opcode == "OUTPUT":
+            return self.parse_file_list(opcode, command, words)
+        elif opcode == "IF":
+            return self.parse_conditional(command)
+        elif opcode == "OTHERWISE" or opcode == "STOP":
+            return Instruction(opcode, command)
+        elif opcode not in COMMAND_PATTERNS:
+            return Instruction(opcode, command)
+            
+        match = COMMAND_PATTERNS[opcode].search(command)
+        if not match:
+            return Instruction(opcode, command, error=f"SYNTAX ERROR in {opcode}: {command}")
+        groups = match.groups()
+        
+        if opcode == "CLOSE-OUT":
+            letters = tuple(letter.strip() for letter in groups[0].split(','))
+            return Instruction(opcode, command, files=letters)
+        elif opcode == "JUMP":
+            return Instruction(opcode, command, targets={"JUMP": groups[0]})
+        elif opcode == "SET":
+            return Instruction(opcode, command, constant=groups)
+        elif opcode == "SORT":
+            fields = tuple(field.strip() for field in groups[1].split(',') if field.strip())
+            return Instruction(opcode, command, files=groups[:1], fields=fields)
+        elif opcode in ("READ-ITEM", "WRITE-ITEM", "REWIND"):
+            targets = {}
+            if opcode == "READ-ITEM" and "END OF DATA" in command:
+                self.parse_branches(command, ("END OF DATA",), targets)
+            return Instruction(opcode, command, files=groups, targets=targets)
+        elif opcode == "TRANSFER":
+            return Instruction(opcode, command, files=groups)
+        elif opcode == "TEST":
+            targets = self.parse_branches(command, ("EQUAL", "GREATER", "LESS", "OTHERWISE"))
+            return Instruction(opcode, command, files=groups[1:2], fields=groups[0:1],
+                               constant=groups[2], targets=targets)
+        
+        # Field operands come in (field, file) pairs
+        instruction = Instruction(opcode, command, files=groups[1::2], fields=groups[0::2])
+        if opcode == "COMPARE":
+            instruction.targets = self.parse_branches(command, ("GREATER", "EQUAL", "OTHERWISE"))
+        return instruction
+
+    def parse_branches(self, command, conditions, targets=None):
+        """Collect the GO TO OPERATION targets for the given conditions"""
+        if targets is None:
+            targets = {}
+        for condition in conditions:
+            match = BRANCH_PATTERNS[condition].search(command)
+            if match:
+                targets[condition] = match.group(1)
+        return targets
+
+    def parse_file_list(self, opcode, command, words):
+        """Parse the file declarations of an INPUT or OUTPUT command"""
+        # Example: INPUT INVENTORY FILE-A PRICE FILE-B
+        names = []
+        letters = []
+        i = 1  # Skip "INPUT"/"OUTPUT"
+        
+        while i < len(words) and words[i] != ";" and words[i] != ".":
+            file_name = words[i]
+            i += 1
+            
+            if i >= len(words) or words[i] == ";" or words[i] == ".":
+                return Instruction(opcode, command, error=f"SYNTAX ERROR in {opcode}: Missing FILE- specification")
+                
+            file_spec = words[i]
+            i += 1
+            
+            if not file_spec.startswith("FILE-"):
+                return Instruction(opcode, command, error=f"SYNTAX ERROR in {opcode}: Expected FILE- but got {file_spec}")
+                
+            names.append(file_name)
+            letters.append(file_spec[5:])
+            
+        return Instruction(opcode, command, files=tuple(letters), constant=tuple(names))
+
+    def parse_conditional(self, command):
+        """Parse a standalone conditional clause"""
+        # Example: IF END OF DATA GO TO OPERATION 14
+        for condition in ("END OF DATA", "GREATER", "EQUAL", "LESS"):
+            if condition in command:
+                break
+        else:
+            if "OTHERWISE" not in command:
+                return Instruction("IF", command, error=f"MALFORMED CONDITIONAL: {command}")
+            condition = "OTHERWISE"
+            
+        if condition == "LESS" and "OTHERWISE" in command:
+            condition = "OTHERWISE"
+            
+        targets = {}
+        match = GO_TO.search(command)
+        if match:
+            targets[condition] = match.group(1)
+        return Instruction("IF", command, constant=condition, targets=targets)
+
+    def bind_program(self):
+        """Bind every parsed operation to its handler in a dense array indexed by operation number"""
+        self.op_index = {}
+        self.op_names = []
+        for op_num in self.operations:
+            if str(int(op_num)) == op_num:
+                self.op_index[op_num] = int(op_num)
+        size = max(self.op_index.values(), default=-1) + 1
+        self.op_names = [str(i) for i in range(size)]
+        for op_num in self.operations:
+            if op_num not in self.op_index:
+                self.op_index[op_num] = len(self.op_names)
+                self.op_names.append(op_num)
+                
+        # Slots without an operation report the missing operation when reached
+        self.fused_through = {}
+        self.code = [self.bind_missing(name) for name in self.op_names]
+        self.successors = [NO_NEXT_OPERATION] * len(self.op_names)
+        self.op_costs = [0] * len(self.op_names)
+        for op_num, instruction in self.operations.items():
+            index = self.op_index[op_num]
+            self.code[index] = self.bind_operation(instruction)
+            self.op_costs[index] = self.operation_cost(instruction)
+            if op_num in self.operation_pointers:
+                self.successors[index] = self.target_index(self.operation_pointers[op_num])
+        return self.code
+
+    def fuse_program(self, barriers=()):
+        """Fuse the straight-line run of operations from each block leader into one superinstruction
+
+        The fused code, and the length, last slot and cost of the block at
+        each slot, are kept in arrays indexed like self.code; slots that
+        start no block keep their single operation. No block runs through a
+        barrier, so execute can put other code in its place.
+        """
+        size = len(self.code)
+        self.fused = list(self.code)
+        self.block_lengths = [1] * size
+        self.block_lasts = list(range(size))
+        self.block_costs = list(self.op_costs)
+        self.block_slots = {}  # Slots of each fused block, by its first slot
+        self.fused_through = {}
+        self.skipped = [0, 0]  # Steps and cost of the operations early exits from blocks left out
+        self.stopped_at = [None]  # Slot in the middle of a block that ended the run
+        
+        # A SET rewires the slot it names, so operations holding one run on their own
+        self.chainable = [False] * size
+        self.falls_through = [False] * size
+        leaders = {self.op_index["0"]}
+        for op_num, instruction in self.operations.items():
+            slot = self.op_index[op_num]
+            commands = (instruction,) + instruction.clauses
+            self.chainable[slot] = all(command.opcode != "SET" for command in commands)
+            self.falls_through[slot] = instruction.opcode not in ("JUMP", "STOP")
+            for command in commands:
+                leaders.update(self.op_index[target_op] for target_op in command.targets.values()
+                               if target_op in self.op_index)
+                if command.opcode == "SET" and command.error is None and command.constant[1] in self.op_index:
+                    leaders.add(self.op_index[command.constant[1]])
+        for slot in barriers:
+            self.chainable[slot] = False
+        
+        # Where a block stops, the operation after it starts another
+        pending = sorted(leaders)
+        while pending:
+            members = self.fuse_block(pending.pop())
+            after = self.successors[members[-1]]
+            if after >= 0 and after not in leaders:
+                leaders.add(after)
+                pending.append(after)
+
+    def fuse_block(self, head):
+        """Build, or rebuild after a SET, the block starting at a slot from the current successors"""
+        for slot in self.block_slots.pop(head, ())[:-1]:
+            self.fused_through[slot].discard(head)
+        members = [head]
+        slot = head
+        if self.chainable[head]:
+            while self.falls_through[slot] and len(members) < MAX_BLOCK:
+                slot = self.successors[slot]
+                if slot < 0 or not self.chainable[slot] or slot in members:
+                    break
+                members.append(slot)
+        
+        if len(members) == 1:
+            self.fused[head] = self.code[head]
+        else:
+            self.fused[head] = self.compile_block(members)
+            self.block_slots[head] = members
+            for slot in members[:-1]:
+                self.fused_through.setdefault(slot, set()).add(head)
+        self.block_lengths[head] = len(members)
+        self.block_lasts[head] = members[-1]
+        self.block_costs[head] = sum(self.op_costs[slot] for slot in members)
+        return members
+
+    def compile_block(self, members):
+        """Generate a superinstruction running a block's operations in turn
+
+        An operation that branches or fails ends the block early, recording
+        the steps and cost it skipped; the last operation's result is the
+        block's, so execute finds the fall-through from the block's last slot.
+        """
+        costs = self.op_costs
+        lines = ["def block():"]
+        for i, slot in enumerate(members[:-1]):
+            lines += [
+                f"    next_op = run{i}()",
+                "    if next_op is not None:",
+                f"        skipped[0] += {len(members) - i - 1}",
+                f"        skipped[1] += {sum(costs[later] for later in members[i + 1:])}",
+                "        if next_op < 0:",
+                f"            stopped_at[0] = {slot}",
+                "        return next_op",
+            ]
+        lines.append(f"    return run{len(members) - 1}()")
+        namespace = {f"run{i}": self.code[slot] for i, slot in enumerate(members)}
+        namespace["skipped"] = self.skipped
+        namespace["stopped_at"] = self.stopped_at
+        exec(compile("\n".join(lines) + "\n", f"<block {self.op_names[members[0]]}>", "exec"), namespace)
+        return namespace["block"]
+
+    def batch_loops(self):
+        """Find the loops that read a record, transform it and write it out, and jump back
+
+        Returns (loop slots, END OF DATA operation) pairs. A loop qualifies
+        when its head is a READ-ITEM with an END OF DATA branch out of the
+        loop, its body is only single TRANSFER, MOVE, arithmetic and
+        WRITE-ITEM commands, and it ends in a JUMP back to the head. Loops
+        with an operation a SET rewires are left to step.
+        """
+        rewired = self.rewired_operations()
+        loops = []
+        for op_num, head in self.operations.items():
+            end_op = self.end_of_data_exit(head)
+            if end_op is None:
+                continue
+            slots = [self.op_index[op_num]]
+            slot = self.successors[slots[0]]
+            while 0 <= slot and len(slots) < MAX_BLOCK and slot not in slots:
+                instruction = self.operations.get(self.op_names[slot])
+                if instruction is None or instruction.error is not None or instruction.clauses:
+                    break
+                slots.append(slot)
+                if instruction.opcode == "JUMP":
+                    if instruction.targets["JUMP"] == op_num and not rewired.intersection(
+                            self.op_names[member] for member in slots):
+                        loops.append((slots, end_op))
+                    break
+                if instruction.opcode not in BATCH_OPCODES:
+                    break
+                slot = self.successors[slot]
+        return loops
+
+    def rewired_operations(self):
+        """Return the numbers of the operations a SET in the program rewires"""
+        return {command.constant[0] for instruction in self.operations.values()
+                for command in (instruction,) + instruction.clauses
+                if command.opcode == "SET" and command.error is None}
+
+    def end_of_data_exit(self, instruction):
+        """Return where a READ-ITEM with nothing else in its operation but an END OF DATA branch
+        elsewhere goes at the end of the data, or None for any other operation"""
+        if instruction.opcode != "READ-ITEM" or instruction.error is not None:
+            return None
+        if "END OF DATA" in instruction.targets and not instruction.clauses:
+            end_op = instruction.targets["END OF DATA"]
+        elif (len(instruction.clauses) == 1 and instruction.clauses[0].opcode == "IF"
+              and instruction.clauses[0].error is None and instruction.clauses[0].constant == "END OF DATA"
+              and "END OF DATA" in instruction.clauses[0].targets):
+            end_op = instruction.clauses[0].targets["END OF DATA"]
+        else:
+            return None
+        if end_op == instruction.number or end_op not in self.operations:
+            return None
+        return end_op
+
+    def join_scans(self):
+        """Find the scans that read a file until a record's key matches the current item of another
+
+        The scan is a READ-ITEM with an END OF DATA exit, falling through to
+        a COMPARE of a key field of each file whose EQUAL branch leaves the
+        scan and whose other outcomes go back to the READ-ITEM. Returns
+        (read slot, compare, END OF DATA operation) triples.
+        """
+        rewired = self.rewired_operations()
+        scans = []
+        for op_num, read in self.operations.items():
+            end_op = self.end_of_data_exit(read)
+            if end_op is None or op_num in rewired:
+                continue
+            compare = self.operations.get(self.op_names[self.successors[self.op_index[op_num]]]) \
+                if self.successors[self.op_index[op_num]] >= 0 else None
+            if (compare is None or compare.opcode != "COMPARE" or compare.error is not None or compare.clauses
+                    or compare.files.count(read.files[0]) != 1):
+                continue
+            targets = compare.targets
+            on_equal = targets.get("EQUAL", targets.get("OTHERWISE"))
+            on_greater = targets.get("GREATER", targets.get("OTHERWISE"))
+            on_less = targets.get("OTHERWISE")
+            if (on_greater == on_less == op_num and on_equal in self.operations
+                    and on_equal not in (op_num, compare.number)):
+                scans.append((self.op_index[op_num], compare, end_op))
+        return scans
+
+    def compile_join(self, slot, compare, end_op, batched):
+        """Build a hash join standing in for a scan found by join_scans
+
+        The first time it runs, the scanned file is read into an
+        IndexedStream keyed on its compared field. Each scan then finds the
+        first matching record at or after the file's position in the
+        index, and leaves the file, current item, comparison status and
+        counts as reading and comparing record by record would have. While
+        any file is at its end, or a key cannot be looked up, it steps.
+        """
+        file_handler = self.file_handler
+        files = file_handler.files
+        current_items = file_handler.current_items
+        end_of_data = file_handler.end_of_data
+        file_pointers = file_handler.file_pointers
+        letter = self.operations[self.op_names[slot]].files[0]
+        probe_first = compare.files[1] == letter  # Whether the other file's key is compared first
+        side = 1 if probe_first else 0
+        field_name = compare.fields[side]
+        probe_letter = compare.files[1 - side]
+        probe_field = compare.fields[1 - side]
+        plain = self.code[slot]
+        after = self.successors[slot]
+        on_equal = self.target_index(compare.targets.get("EQUAL", compare.targets.get("OTHERWISE")))
+        on_end = self.target_index(end_op)
+        read_cost = self.op_costs[slot]
+        round_cost = read_cost + self.op_costs[self.op_index[compare.number]]
+        
+        def step():
+            batched[0] += 1
+            batched[1] += read_cost
+            next_op = plain()
+            return after if next_op is None else next_op
+        
+        def join():
+            stream = files.get(letter)
+            item = current_items.get(probe_letter)
+            if stream is None or item is None or True in end_of_data.values():
+                return step()
+            if stream.__class__ is not IndexedStream or stream.field_name != field_name:
+                try:
+                    stream = files[letter] = IndexedStream(stream, field_name, file_pointers[letter])
+                except Exception as e:
+                    files[letter] = None
+                    self.log.error("ERROR reading file %s: %s", letter, e)
+                    batched[0] += 1
+                    batched[1] += read_cost
+                    return self.fault(self.operations[self.op_names[slot]])
+            probe_slot = item.schema.slots.get(probe_field)
+            if stream.keys is None or probe_slot is None:
+                return step()
+            key = item.data[probe_slot]
+            start = stream.position
+            found = stream.find(key, start)
+            if found is None:
+                last = len(stream.records) - 1
+                end_of_data[letter] = True
+                next_op = on_end
+            else:
+                last = found
+                next_op = on_equal
+            scanned = last - start + 1
+            if scanned > 0:
+                stream.position = last
+                current_items[letter] = stream.read()
+                file_pointers[letter] += scanned
+                file_handler.records_read += scanned
+                if found is not None:
+                    self.compare_status = "EQUAL"
+                else:
+                    other = stream.key_at(last)
+                    value1, value2 = (key, other) if probe_first else (other, key)
+                    self.compare_status = "GREATER" if value1 > value2 else "EQUAL" if value1 == value2 else "LESS"
+            # Each record read was compared; reaching the end took one more read
+            batched[0] += 2 * scanned + (found is None)
+            batched[1] += scanned * round_cost + (read_cost if found is None else 0)
+            return next_op
+        return join
+
+    def compile_batch(self, slots, end_op, batched, stopped_at):
+        """Generate a loop running whole iterations of a batch loop at a time
+
+        The loop reads records straight from the input stream and keeps the
+        current items in locals, resolving field slots once per schema. It
+        returns the END OF DATA target after the last record. While any
+        file is at its end, it steps instead, as IF END OF DATA looks at
+        every file. At anything it cannot do exactly like stepping would,
+        such as a missing field, it puts the current items back and returns
+        the operation to step from; a failed read, calculation or write
+        faults as the operation would. The steps and cost of what it ran
+        are added to batched.
+        """
+        commands = [self.operations[self.op_names[slot]] for slot in slots]
+        head = commands[0]
+        read_letter = head.files[0]
+        letters = sorted({letter for command in commands for letter in command.files})
+        written = sorted({command.files[0] for command in commands if command.opcode == "WRITE-ITEM"})
+        local = {letter: f"item{i}" for i, letter in enumerate(letters)}
+        costs = [0]
+        for slot in slots:
+            costs.append(costs[-1] + self.op_costs[slot])
+        caches = []  # Names of the per-schema slot caches
+        
+        lines = ["def batch():",
+                 f"    stream = files.get({read_letter!r})"]
+        for letter in written:
+            lines.append(f"    writer_{local[letter]} = output_files.get({letter!r})")
+        lines.append(f"    if stream is None{''.join(f' or writer_{local[letter]} is None' for letter in written)}"
+                     " or True in end_of_data.values():")
+        lines.append("        return fallback()")
+        lines.append("    read = stream.read")
+        for letter in letters:
+            lines.append(f"    {local[letter]} = current_items.get({letter!r})")
+        lines += ["    loops = reads = writes = 0",
+                  "    failed = None",
+                  "    while True:",
+                  "        try:",
+                  "            record = read()",
+                  "        except Exception as error:",
+                  f"            log.error('ERROR reading file %s: %s', {read_letter!r}, error)",
+                  "            failed = 0",
+                  "            position, result = 1, FAULT",
+                  "            break",
+                  "        if record is None:",
+                  f"            end_of_data[{read_letter!r}] = True",
+                  f"            position, result = 1, {self.target_index(end_op)}",
+                  "            break",
+                  "        reads += 1",
+                  f"        {local[read_letter]} = record"]
+        
+        def bail(position, indent):
+            # Hand the operation at position back to stepping, which reports any error itself
+            lines.append(f"{' ' * indent}position, result = {position}, {slots[position]}")
+            lines.append(f"{' ' * indent}break")
+        
+        def get(position, letter, field, into):
+            item = local[letter]
+            schema, slot = f"schema{len(caches)}", f"slot{len(caches)}"
+            caches.append((schema, slot))
+            lines.append(f"        if {item} is None:")
+            bail(position, 12)
+            lines.append(f"        if {item}.schema is not {schema}:")
+            lines.append(f"            {slot} = {item}.schema.slots.get({field!r})")
+            lines.append(f"            if {slot} is None:")
+            bail(position, 16)
+            lines.append(f"            {schema} = {item}.schema")
+            lines.append(f"        {into} = {item}.data[{slot}]")
+        
+        def put(letter, field, value):
+            # Like FileHandler.field_setter: a missing item is created, a missing field appended
+            item = local[letter]
+            schema, slot = f"schema{len(caches)}", f"slot{len(caches)}"
+            caches.append((schema, slot))
+            lines.append(f"        if {item} is None:")
+            lines.append(f"            {item} = Record(EMPTY_SCHEMA, [])")
+            lines.append(f"        if {item}.schema is not {schema}:")
+            lines.append(f"            {schema} = {item}.schema")
+            lines.append(f"            {slot} = {schema}.slots.get({field!r})")
+            lines.append(f"        if {item}.shared:")
+            lines.append(f"            {item}.unshare()")
+            lines.append(f"        if {slot} is None:")
+            lines.append(f"            {item}.schema = {item}.schema.extend({field!r})")
+            lines.append(f"            {item}.data.append({value})")
+            lines.append("        else:")
+            lines.append(f"            {item}.data[{slot}] = {value}")
+        
+        compute = {"ADD": "add_values", "SUBTRACT": "subtract_values",
+                   "MULTIPLY": "multiply_values", "DIVIDE": "divide_values"}
+        for position, command in enumerate(commands[1:-1], 1):
+            if command.opcode == "TRANSFER":
+                source, target = command.files
+                lines.append(f"        if {local[source]} is None:")
+                bail(position, 12)
+                lines.append(f"        {local[target]} = {local[source]}.share()")
+            elif command.opcode == "MOVE":
+                get(position, command.files[0], command.fields[0], "value1")
+                put(command.files[1], command.fields[1], "value1")
+            elif command.opcode == "WRITE-ITEM":
+                item = local[command.files[0]]
+                lines.append(f"        if {item} is None:")
+                bail(position, 12)
+                lines.append("        try:")
+                lines.append(f"            writer_{item}.write({item})")
+                lines.append("        except Exception as error:")
+                # Like FileHandler.write_item; a write that failed is not tried again
+                lines.append(f"            log.error('ERROR writing to file %s: %s', {command.files[0]!r}, error)")
+                lines.append(f"            failed = {position}")
+                lines.append(f"            position, result = {position + 1}, FAULT")
+                lines.append("            break")
+                lines.append("        writes += 1")
+            else:
+                get(position, command.files[0], command.fields[0], "value1")
+                get(position, command.files[1], command.fields[1], "value2")
+                lines.append(f"        value = {compute[command.opcode]}(value1, value2)")
+                lines.append("        if value is None:")
+                lines.append(f"            failed = {position}")
+                lines.append(f"            position, result = {position + 1}, FAULT")
+                lines.append("            break")
+                put(command.files[-1], command.fields[-1], "value")
+        lines.append("        loops += 1")
+        
+        # Put back what stepping would see, and count what ran
+        for letter in letters:
+            lines.append(f"    current_items[{letter!r}] = {local[letter]}")
+        lines += [f"    file_pointers[{read_letter!r}] += reads",
+                  "    file_handler.records_read += reads",
+                  "    file_handler.records_written += writes",
+                  f"    batched[0] += loops * {len(slots)} + position",
+                  f"    batched[1] += loops * {costs[-1]} + COSTS[position]",
+                  "    if failed is not None:",
+                  "        stopped_at[0] = SLOTS[failed]",
+                  "        return fault(COMMANDS[failed])",
+                  "    return result"]
+        # The slot caches start out matching no schema
+        lines[1:1] = [f"    {schema} = {slot} = None" for schema, slot in caches]
+        
+        file_handler = self.file_handler
+        plain = self.code[slots[0]]
+        after = self.successors[slots[0]]
+        
+        def fallback():
+            # Without the stream or writers, the head steps on its own
+            batched[0] += 1
+            batched[1] += costs[1]
+            next_op = plain()
+            return after if next_op is None else next_op
+        
+        namespace = {
+            "files": file_handler.files,
+            "output_files": file_handler.output_files,
+            "current_items": file_handler.current_items,
+            "end_of_data": file_handler.end_of_data,
+            "file_pointers": file_handler.file_pointers,
+            "file_handler": file_handler,
+            "log": self.log,
+            "Record": Record,
+            "EMPTY_SCHEMA": EMPTY_SCHEMA,
+            "FAULT": FAULT,
+            "fault": self.fault,
+            "fallback": fallback,
+            "batched": batched,
+            "stopped_at": stopped_at,
+            "COSTS": costs,
+            "SLOTS": slots,
+            "COMMANDS": commands,
+        }
+        for opcode, method in compute.items():
+            namespace[method] = getattr(self, method)
+        exec(compile("\n".join(lines) + "\n", f"<batch {head.number}>", "exec"), namespace)
+        return namespace["batch"]
+
+    def operation_cost(self, instruction):
+        """Simulated UNIVAC II time of an operation in microseconds"""
+        commands = (instruction,) + instruction.clauses
+        return sum(UNIVAC_COSTS.get(command.opcode, 0) for command in commands)
+
+    def target_index(self, target_op):
+        """Resolve an operation number to its slot in the dispatch array"""
+        if target_op is None:
+            return END_OF_PROGRAM
+        if target_op not in self.op_index:
+            self.op_index[target_op] = len(self.op_names)
+            self.op_names.append(target_op)
+            self.code.append(self.bind_missing(target_op))
+            self.successors.append(NO_NEXT_OPERATION)
+            self.op_costs.append(0)
+        return self.op_index[target_op]
+
+    def bind_operation(self, instruction):
+        """Bind an operation and its trailing clauses into a single callable"""
+        op_num = instruction.number
+        
+        def resolve(target_op):
+            # A branch to the operation itself is not a branch at all: the
+            # remaining clauses still run and the operation then falls through
+            if target_op == op_num:
+                return None
+            return self.target_index(target_op)
+        
+        commands = (instruction,) + instruction.clauses
+        bound = tuple((command.text, self.bind_command(command, resolve)) for command in commands)
+        trace = self.log.trace
+        if not self.log.show_trace:
+            if len(bound) == 1:
+                return bound[0][1]
+            runs = tuple(run for text, run in bound)
+            
+            def step():
+                for run in runs:
+                    next_op = run()
+                    if next_op is not None:
+                        return next_op
+                return None
+            return step
+        
+        def step():
+            trace("Executing operation %s", op_num)
+            for text, run in bound:
+                trace("Executing: %s", text)
+                next_op = run()
+                if next_op is not None:
+                    return next_op
+            return None
+        return step
+
+    def bind_command(self, command, resolve):
+        """Bind a single command to its handler"""
+        if command.error is not None:
+            return self.bind_error(command, resolve)
+        binder = self.BINDERS.get(command.opcode, FlowmaticInterpreter.bind_unknown)
+        return binder(self, command, resolve)
+
+    def fault(self, command):
+        """Report the operation a failed command belongs to and halt"""
+        self.log.error("ERROR in operation (%s): %s", command.number, command.text)
+        return FAULT
+
     def execute(self):
         """Execute the program"""
         if "0" not in self.operations:
-            print("ERROR: Program must start with operation 0")
+            self.log.error("ERROR: Program must start with operation 0")
+            return False
+            
+        if self.pacing not in PACING_MODES:
+            self.log.error("ERROR: Unknown pacing mode %s", self.pacing)
             return False
             
         self.current_operation_number = "0"
         self.running = True
+        code = self.bind_program()
+        successors = self.successors
+        names = self.op_names
+        costs = self.op_costs
+        realtime = self.pacing == "realtime"
+        virtual = self.pacing == "virtual"
+        tracing = self.log.show_trace
         
-        while self.running:
-            if self.current_operation_number not in self.operations:
-                print(f"ERROR: Operation {self.current_operation_number} not found")
-                return False
-                
-            self.debug_print(f"Executing operation {self.current_operation_number}")
-            tokens = self.operations[self.current_operation_number]
-            commands = self.extract_commands(tokens)
+        pc = self.op_index["0"]
+        started = time.perf_counter()
+        if self.profiler is not None or self.recorder is not None or self.replay is not None:
+            return self.execute_instrumented(code, pc, started)
+        
+        # Loops and scans run by batches or hash joins instead, at full speed and without a trace
+        full_speed = not realtime and not tracing
+        loops = self.batch_loops() if self.batching and full_speed else []
+        scans = self.join_scans() if self.hash_joins and full_speed else []
+        
+        # Straight-line runs of operations are fused too
+        if self.superinstructions and full_speed:
+            self.fuse_program([slots[0] for slots, end_op in loops] + [slot for slot, compare, end_op in scans])
+            code = self.fused
+            lengths = self.block_lengths
+            lasts = self.block_lasts
+            costs = self.block_costs
+            skipped = self.skipped
+            stopped_at = self.stopped_at
+        else:
+            code = list(code)
+            lengths = [1] * len(code)
+            lasts = list(range(len(code)))
+            costs = list(costs)
+            skipped = [0, 0]
+            stopped_at = [None]
+        
+        # Read-transform-write loops run whole iterations at a time and scans jump to their match,
+        # counting their own steps
+        batched = [0, 0]
+        engines = [(slots[0], self.compile_batch(slots, end_op, batched, stopped_at)) for slots, end_op in loops]
+        engines += [(slot, self.compile_join(slot, compare, end_op, batched)) for slot, compare, end_op in scans]
+        for head, run in engines:
+            code[head] = run
+            lengths[head] = 0
+            lasts[head] = head
+            costs[head] = 0
+        
+        op = pc
+        steps = 0
+        clock = 0
+        while pc >= 0:
+            op = pc
+            next_op = code[pc]()
+            steps += lengths[pc]
             
-            # Save the operation number before processing commands
-            # This helps detect if a branch or jump has occurred
-            original_op_num = self.current_operation_number
+            # Bound operations return None to fall through to their successor
+            if next_op is None:
+                pc = successors[lasts[pc]]
+            else:
+                if tracing and next_op >= 0:
+                    self.log.trace("Branched from operation %s to %s", names[pc], names[next_op])
+                pc = next_op
+                
+            if realtime:
+                time.sleep(REALTIME_DELAY)
+            elif virtual:
+                clock += costs[op]
+        
+        # Blocks left early did not run their remaining operations
+        last = stopped_at[0] if stopped_at[0] is not None else lasts[op]
+        self.steps_executed = steps - skipped[0] + batched[0]
+        self.simulated_time = (clock - skipped[1] + batched[1]) / 1000000
+        return self.finish_run(pc, names[last], started)
+
+    def execute_instrumented(self, code, pc, started):
+        """The execute loop with a profiler, trace recorder or replay watching every step"""
+        profiler = self.profiler
+        recorder = self.recorder
+        replay = self.replay
+        profiling = profiler is not None
+        if profiling:
+            profiler.start(self)
+        else:
+            profiler = Profiler()  # Never filled in; keeps the counters below bound
+        if recorder is not None:
+            recorder.start(self.op_names)
+        counts = profiler.counts
+        times = profiler.times
+        reads = profiler.reads
+        writes = profiler.writes
+        edges = profiler.edges
+        rewired = profiler.rewired
+        file_handler = self.file_handler
+        file_handler.recorder = recorder
+        file_handler.replay = replay
+        successors = self.successors
+        original = list(successors)  # Successors before any SET
+        names = self.op_names
+        costs = self.op_costs
+        realtime = self.pacing == "realtime"
+        virtual = self.pacing == "virtual"
+        tracing = self.log.show_trace
+        clock_now = time.perf_counter
+        
+        op = pc
+        steps = 0
+        clock = 0
+        while pc >= 0:
+            op = pc
+            if recorder is not None:
+                recorder.step(op)
+            if replay is not None and not replay.step(names[op]):
+                pc = FAULT
+                break
+            if not profiling:
+                next_op = code[pc]()
+            else:
+                records_read = file_handler.records_read
+                records_written = file_handler.records_written
+                began = clock_now()
+                next_op = code[pc]()
+                times[op] += clock_now() - began
+                counts[op] += 1
+                reads[op] += file_handler.records_read - records_read
+                writes[op] += file_handler.records_written - records_written
+            steps += 1
             
-            for command in commands:
-                print(f"Executing: {command}")
-                result = self.process_command(command)
-                if result < 0:
-                    print(f"ERROR in operation ({original_op_num}): {command}")
-                    return False
+            if next_op is None:
+                pc = successors[op]
+                if profiling and pc != original[op]:
+                    rewired.add((op, pc))
+            else:
+                if tracing and next_op >= 0:
+                    self.log.trace("Branched from operation %s to %s", names[op], names[next_op])
+                pc = next_op
+            if profiling and pc >= 0:
+                edges[op, pc] = edges.get((op, pc), 0) + 1
                 
-                # If the operation number changed, a branch or jump occurred
-                # So don't continue processing commands from this operation
-                if self.current_operation_number != original_op_num:
-                    self.debug_print(f"Branched from operation {original_op_num} to {self.current_operation_number}")
-                    break
-                        
-            # Move to next operation if not redirected (i.e., if no branch/jump occurred)
-            if self.running and self.current_operation_number == original_op_num:
-                if self.current_operation_number in self.operation_pointers:
-                    next_op = self.operation_pointers[self.current_operation_number]
-                    if next_op is None:
-                        print(f"End of program reached after operation {self.current_operation_number}")
-                        self.running = False
-                    else:
-                        self.current_operation_number = next_op
-                else:
-                    print(f"No next operation defined after {self.current_operation_number}")
-                    self.running = False
-            time.sleep(0.01) # VERY rough estimation of UNIVAC II speeds 
+            if realtime:
+                time.sleep(REALTIME_DELAY)
+            elif virtual:
+                clock += costs[op]
+        
+        file_handler.recorder = None
+        file_handler.replay = None
+        self.steps_executed = steps
+        self.simulated_time = clock / 1000000
+        profiler.steps = steps
+        profiler.elapsed = time.perf_counter() - started
+        result = self.finish_run(pc, names[op], started)
+        if recorder is not None:
+            recorder.finish(pc, names[op], self.compare_status, steps)
+        if replay is not None:
+            divergence = replay.check_finish(pc, names[op], self.compare_status, steps)
+            replay.close()
+            if divergence is not None:
+                self.log.error("%s", divergence)
+                return False
+            self.log.summary("Replay matched the trace for all %s steps", steps)
+        return result
+
+    def execute_compiled(self):
+        """Execute the program as a Python function generated by FlowmaticCompiler"""
+        if "0" not in self.operations:
+            self.log.error("ERROR: Program must start with operation 0")
+            return False
+            
+        if self.pacing not in PACING_MODES:
+            self.log.error("ERROR: Unknown pacing mode %s", self.pacing)
+            return False
+            
+        self.current_operation_number = "0"
+        self.running = True
+        program = FlowmaticCompiler(self).compile()
+        
+        started = time.perf_counter()
+        outcome, last_op = program(self)
+        return self.finish_run(outcome, last_op, started)
+
+    def finish_run(self, outcome, last_op, started):
+        """Record the end of a run and report how it ended"""
+        self.elapsed_time = time.perf_counter() - started
+        self.current_operation_number = last_op
+        self.running = False
+        self.file_handler.close_files()
+        
+        if self.pacing == "virtual":
+            self.log.summary("Simulated UNIVAC II time: %.3f s", self.simulated_time)
+        if outcome == FAULT:
+            return False
+        if outcome == END_OF_PROGRAM:
+            self.log.summary("End of program reached after operation %s", last_op)
+        elif outcome == NO_NEXT_OPERATION:
+            self.log.summary("No next operation defined after %s", last_op)
         return True
 
-    def process_command(self, command):
-        """Process a FLOW-MATIC command"""
-        if not command:
-            return 0
-            
-        # Split the command into words for processing
-        words = command.split()
-        if not words:
-            return 0
-            
-        # Get the primary command type (first word)
-        command_type = words[0]
-        
-        # Handle each command type
-        if command_type == "INPUT":
-            return self.input_file(command)
-        elif command_type == "OUTPUT":
-            return self.output_file(command)
-        elif command_type == "COMPARE":
-            return self.compare(command)
-        elif command_type == "READ-ITEM":
-            return self.read_item(command)
-        elif command_type == "WRITE-ITEM":
-            return self.write_item(command)
-        elif command_type == "TRANSFER":
-            return self.transfer(command)
-        elif command_type == "MOVE":
-            return self.move(command)
-        elif command_type == "JUMP":
-            return self.jump(command)
-        elif command_type == "STOP":
-            return self.stop(command)
-        elif command_type == "TEST":
-            return self.test(command)
-        elif command_type == "SET":
-            return self.set(command)
-        elif command_type == "REWIND":
-            return self.rewind(command)
-        elif command_type == "CLOSE-OUT":
-            return self.close_out(command)
-        elif command_type == "ADD":
-            return self.add(command)
-        elif command_type == "SUBTRACT":
-            return self.subtract(command)
-        elif command_type == "MULTIPLY":
-            return self.multiply(command)
-        elif command_type == "DIVIDE":
-            return self.divide(command)
-        elif command_type == "IF":
-            return self.process_conditional(command)
+    @property
+    def ops_per_second(self):
+        """Operations executed per second of wall time by the last run"""
+        if self.elapsed_time <= 0:
+            return 0.0
+        return self.steps_executed / self.elapsed_time
+
+    def bind_missing(self, op_num):
+        """Bind an empty slot of the dispatch array"""
+        def step():
+            self.log.error("ERROR: Operation %s not found", op_num)
+            return FAULT
+        return step
+
+    def bind_error(self, command, resolve):
+        """Bind a command that failed to parse"""
+        def run():
+            self.log.error(command.error)
+            return self.fault(command)
+        return run
+
+    def bind_unknown(self, command, resolve):
+        """Bind a command with an unrecognised opcode"""
+        def run():
+            self.log.error("UNKNOWN COMMAND: %s --- HALTED.", command.text)
+            self.running = False
+            return self.fault(command)
+        return run
+
+    def bind_nop(self, command, resolve):
+        """Bind an empty operation"""
+        return lambda: None
+
+    def bind_otherwise(self, command, resolve):
+        """Bind a standalone OTHERWISE clause"""
         # This is the important part: ignore "OTHERWISE" as it should be
         # handled within the COMPARE or TEST operations
-        elif command_type == "OTHERWISE":
-            self.debug_print(f"Ignoring standalone 'OTHERWISE' - it should be handled by COMPARE/TEST: {command}")
-            return 0
-        else:
-            print(f"UNKNOWN COMMAND: {command} --- HALTED.")
-            self.running = False
-            return -1
+        message = f"Ignoring standalone 'OTHERWISE' - it should be handled by COMPARE/TEST: {command.text}"
+        
+        def run():
+            self.log.trace(message)
+            return None
+        return run
 
-    def process_conditional(self, command):
-        """Process standalone conditional statements"""
+    def bind_conditional(self, command, resolve):
+        """Bind standalone conditional statements"""
         # This handles IF statements that are their own commands (not part of COMPARE/TEST)
-        if "END OF DATA" in command:
+        condition = command.constant
+        if condition not in command.targets:
+            return lambda: None
+        target_op = command.targets[condition]
+        target = resolve(target_op)
+        
+        if condition == "END OF DATA":
             # Example: IF END OF DATA GO TO OPERATION 14
-            match = re.search(r'GO TO OPERATION (\d+)', command)
-            if match:
-                for file_letter in self.file_handler.end_of_data:
-                    if self.file_handler.end_of_data[file_letter]:
-                        target_op = match.group(1)
-                        self.debug_print(f"Conditional branch to operation {target_op} (END OF DATA)")
-                        self.current_operation_number = target_op
-                        return 0
-            return 0
-            
-        elif "GREATER" in command:
-            # Example: IF GREATER GO TO OPERATION 10
-            match = re.search(r'GO TO OPERATION (\d+)', command)
-            if match and self.compare_status == "GREATER":
-                target_op = match.group(1)
-                self.debug_print(f"Conditional branch to operation {target_op} (GREATER)")
-                self.current_operation_number = target_op
-            return 0
-            
-        elif "EQUAL" in command:
-            # Example: IF EQUAL GO TO OPERATION 5
-            match = re.search(r'GO TO OPERATION (\d+)', command)
-            if match and self.compare_status == "EQUAL":
-                target_op = match.group(1)
-                self.debug_print(f"Conditional branch to operation {target_op} (EQUAL)")
-                self.current_operation_number = target_op
-            return 0
-            
-        elif "LESS" in command or "OTHERWISE" in command:
-            # Example: OTHERWISE GO TO OPERATION 2
-            match = re.search(r'GO TO OPERATION (\d+)', command)
-            if match:
-                if "OTHERWISE" in command or self.compare_status == "LESS":
-                    target_op = match.group(1)
-                    self.debug_print(f"Conditional branch to operation {target_op} (OTHERWISE/LESS)")
-                    self.current_operation_number = target_op
-            return 0
+            end_of_data = self.file_handler.end_of_data
+            message = f"Conditional branch to operation {target_op} (END OF DATA)"
+            
+            def run():
+                if True in end_of_data.values():
+                    self.log.trace(message)
+                    return target
+                return None
+            return run
             
-        print(f"MALFORMED CONDITIONAL: {command}")
-        return -1
+        label = "OTHERWISE/LESS" if condition in ("LESS", "OTHERWISE") else condition
+        message = f"Conditional branch to operation {target_op} ({label})"
+        if condition == "OTHERWISE":
+            def run():
+                self.log.trace(message)
+                return target
+            return run
+            
+        # Example: IF GREATER GO TO OPERATION 10
+        def run():
+            if self.compare_status == condition:
+                self.log.trace(message)
+                return target
+            return None
+        return run
 
-    def jump(self, command):
-        """Handle JUMP operation"""
+    def bind_jump(self, command, resolve):
+        """Bind JUMP operation"""
         # Example: JUMP TO OPERATION 8
-        match = re.search(r'JUMP TO OPERATION (\d+)', command)
-        if not match:
-            print(f"SYNTAX ERROR in JUMP: {command}")
-            return -1
-            
-        jump_op = match.group(1)
+        jump_op = command.targets["JUMP"]
         if jump_op not in self.operations:
-            print(f"ERROR: OPERATION {jump_op} NOT IN OPERATIONS.")
-            return -1 
+            def run():
+                self.log.error("ERROR: OPERATION %s NOT IN OPERATIONS.", jump_op)
+                return self.fault(command)
+            return run
             
-        self.debug_print(f"Jumping to operation {jump_op}")
-        self.current_operation_number = jump_op
-        return 0
+        target = resolve(jump_op)
+        message = f"Jumping to operation {jump_op}"
+        
+        def run():
+            self.log.trace(message)
+            return target
+        return run
 
-    def input_file(self, command):
-        """Handle INPUT operation"""
+    def bind_input(self, command, resolve):
+        """Bind INPUT operation"""
         # Example: INPUT INVENTORY FILE-A PRICE FILE-B
-        parts = command.split()
-        i = 1  # Skip "INPUT"
+        file_handler = self.file_handler
+        declarations = tuple(zip(command.constant, command.files))
         
-        while i < len(parts) and parts[i] != ";":
-            if i >= len(parts):
-                break
-                
-            file_name = parts[i]
-            i += 1
-            
-            if i >= len(parts) or parts[i] == ";":
-                print(f"SYNTAX ERROR in INPUT: Missing FILE- specification")
-                return -1
-                
-            file_spec = parts[i]
-            i += 1
-            
-            if not file_spec.startswith("FILE-"):
-                print(f"SYNTAX ERROR in INPUT: Expected FILE- but got {file_spec}")
-                return -1
+        def run():
+            for file_name, file_letter in declarations:
+                file_handler.register_file(file_letter, file_name)
                 
-            file_letter = file_spec[5:]
-            self.file_handler.register_file(file_letter, file_name)
-            
-            # In a real implementation, load data from a file
-            data_file = f"{file_name.lower()}.dat"
-            self.file_handler.load_file(file_letter, data_file)
-            
-        return 0
+                file_handler.load_file(file_letter, file_handler.input_file(file_name, file_letter))
+            return None
+        return run
 
-    def output_file(self, command):
-        """Handle OUTPUT portion of INPUT operation"""
-        # Example: OUTPUT PRICED-INV FILE-C UNPRICED-INV FILE-D ; HSP D .
-        parts = command.split()
-        i = 1  # Skip "OUTPUT"
+    def bind_output(self, command, resolve):
+        """Bind OUTPUT portion of INPUT operation"""
+        # Example: OUTPUT PRICED-INV FILE-C UNPRICED-INV FILE-D
+        file_handler = self.file_handler
+        declarations = tuple(zip(command.constant, command.files))
         
-        while i < len(parts) and parts[i] != ";" and parts[i] != ".":
-            if i >= len(parts):
-                break
-                
-            file_name = parts[i]
-            i += 1
-            
-            if i >= len(parts) or parts[i] == ";" or parts[i] == ".":
-                print(f"SYNTAX ERROR in OUTPUT: Missing FILE- specification")
-                return -1
-                
-            file_spec = parts[i]
-            i += 1
-            
-            if not file_spec.startswith("FILE-"):
-                print(f"SYNTAX ERROR in OUTPUT: Expected FILE- but got {file_spec}")
-                return -1
-                
-            file_letter = file_spec[5:]
-            self.file_handler.register_file(file_letter, file_name, is_output=True)
-            
-        # Check for HSP (High Speed Printer) specification
-        if i < len(parts) and parts[i] == ";":
-            i += 1
-            if i < len(parts) and parts[i] == "HSP":
-                i += 1
-                if i < len(parts):
-                    printer_file = parts[i]
-                    self.debug_print(f"File {printer_file} marked for High Speed Printer output")
-                    
-        return 0
-
-    def transfer(self, command):
-        """Handle TRANSFER operation"""
+        def run():
+            for file_name, file_letter in declarations:
+                file_handler.register_file(file_letter, file_name, is_output=True)
+            return None
+        return run
+
+    def bind_transfer(self, command, resolve):
+        """Bind TRANSFER operation"""
         # Example: TRANSFER A TO D
-        match = re.search(r'TRANSFER (\w+) TO (\w+)', command)
-        if not match:
-            print(f"SYNTAX ERROR in TRANSFER: {command}")
-            return -1
-            
-        from_file = match.group(1)
-        to_file = match.group(2)
+        transfer_item = self.file_handler.transfer_item
+        from_file, to_file = command.files
         
-        if not self.file_handler.transfer_item(from_file, to_file):
-            return -1
-            
-        return 0
+        def run():
+            if not transfer_item(from_file, to_file):
+                return self.fault(command)
+            return None
+        return run
+
+    def branch_outcomes(self, command, resolve, conditions, labels):
+        """Decide the branch taken for each comparison result, falling back to OTHERWISE"""
+        targets = command.targets
+        outcomes = {}
+        for condition in conditions:
+            for choice in (condition, "OTHERWISE"):
+                if choice in targets:
+                    target_op = targets[choice]
+                    outcomes[condition] = (resolve(target_op), labels[choice].format(target_op))
+                    break
+            else:
+                outcomes[condition] = None
+        return outcomes
 
-    def compare(self, command):
-        """Handle COMPARE operation"""
+    def bind_compare(self, command, resolve):
+        """Bind COMPARE operation"""
         # Example: COMPARE PRODUCT-NO (A) WITH PRODUCT-NO (B) ; IF GREATER GO TO OPERATION 10 ; IF EQUAL GO TO OPERATION 5 ; OTHERWISE GO TO OPERATION 2
+        field1, field2 = command.fields
+        file1, file2 = command.files
+        get_value1 = self.file_handler.field_getter(file1, field1)
+        get_value2 = self.file_handler.field_getter(file2, field2)
+        labels = {
+            "GREATER": "Branching to operation {} (GREATER)",
+            "EQUAL": "Branching to operation {} (EQUAL)",
+            "OTHERWISE": "Branching to operation {} (OTHERWISE)",
+        }
+        # A LESS result can only be caught by OTHERWISE
+        outcomes = self.branch_outcomes(command, resolve, ("GREATER", "EQUAL", "LESS"), labels)
+        on_greater, on_equal, on_less = outcomes["GREATER"], outcomes["EQUAL"], outcomes["LESS"]
         
-        # First, extract the field comparison part
-        match = re.search(r'COMPARE (\S+) \((\w+)\) WITH (\S+) \((\w+)\)', command)
-        if not match:
-            print(f"SYNTAX ERROR in COMPARE: {command}")
-            return -1
-            
-        field1 = match.group(1)
-        file1 = match.group(2)
-        field2 = match.group(3)
-        file2 = match.group(4)
-        
-        val1 = self.file_handler.get_field(file1, field1)
-        val2 = self.file_handler.get_field(file2, field2)
-        
-        if val1 is None or val2 is None:
-            return -1
+        def run():
+            val1 = get_value1()
+            val2 = get_value2()
             
-        self.debug_print(f"Comparing {val1} with {val2}")
-        
-        if val1 > val2:
-            self.compare_status = "GREATER"
-        elif val1 == val2:
-            self.compare_status = "EQUAL"
-        else:
-            self.compare_status = "LESS"
-            
-        # Now process the conditional branching parts
-        if "IF GREATER GO TO OPERATION" in command:
-            match = re.search(r'IF GREATER GO TO OPERATION (\d+)', command)
-            if match and self.compare_status == "GREATER":
-                target_op = match.group(1)
-                self.debug_print(f"Branching to operation {target_op} (GREATER)")
-                self.current_operation_number = target_op
-                return 0
+            if val1 is None or val2 is None:
+                return self.fault(command)
                 
-        if "IF EQUAL GO TO OPERATION" in command:
-            match = re.search(r'IF EQUAL GO TO OPERATION (\d+)', command)
-            if match and self.compare_status == "EQUAL":
-                target_op = match.group(1)
-                self.debug_print(f"Branching to operation {target_op} (EQUAL)")
-                self.current_operation_number = target_op
-                return 0
-                
-        if "OTHERWISE GO TO OPERATION" in command:
-            match = re.search(r'OTHERWISE GO TO OPERATION (\d+)', command)
-            if match:
-                target_op = match.group(1)
-                self.debug_print(f"Branching to operation {target_op} (OTHERWISE)")
-                self.current_operation_number = target_op
-                return 0
+            self.log.trace("Comparing %s with %s", val1, val2)
+            
+            if val1 > val2:
+                self.compare_status = "GREATER"
+                outcome = on_greater
+            elif val1 == val2:
+                self.compare_status = "EQUAL"
+                outcome = on_equal
+            else:
+                self.compare_status = "LESS"
+                outcome = on_less
                 
-        return 0
+            if outcome is None:
+                return None
+            target, message = outcome
+            self.log.trace(message)
+            return target
+        return run
 
-    def read_item(self, command):
-        """Handle READ-ITEM operation"""
+    def bind_read_item(self, command, resolve):
+        """Bind READ-ITEM operation"""
         # Example: READ-ITEM A ; IF END OF DATA GO TO OPERATION 14
-        match = re.search(r'READ-ITEM (\w+)', command)
-        if not match:
-            print(f"SYNTAX ERROR in READ-ITEM: {command}")
-            return -1
-            
-        file_letter = match.group(1)
-        success = self.file_handler.read_item(file_letter)
+        read_item = self.file_handler.read_item
+        file_letter = command.files[0]
         
-        # Process END OF DATA condition if present in command
-        if not success and "END OF DATA" in command:
-            match = re.search(r'IF END OF DATA GO TO OPERATION (\d+)', command)
-            if match:
-                target_op = match.group(1)
-                self.debug_print(f"End of data, branching to operation {target_op}")
-                self.current_operation_number = target_op
-                
-        return 0
-
-    def write_item(self, command):
-        """Handle WRITE-ITEM operation"""
-        # Example: WRITE-ITEM D
-        match = re.search(r'WRITE-ITEM (\w+)', command)
-        if not match:
-            print(f"SYNTAX ERROR in WRITE-ITEM: {command}")
-            return -1
+        # END OF DATA condition when it is part of this command
+        if "END OF DATA" in command.targets:
+            target_op = command.targets["END OF DATA"]
+            target = resolve(target_op)
+            message = f"End of data, branching to operation {target_op}"
             
-        file_letter = match.group(1)
-        if not self.file_handler.write_item(file_letter):
-            return -1
+            def run():
+                read = read_item(file_letter)
+                if not read:
+                    if read is None:
+                        return self.fault(command)
+                    self.log.trace(message)
+                    return target
+                return None
+            return run
             
-        return 0
+        def run():
+            if read_item(file_letter) is None:
+                return self.fault(command)
+            return None
+        return run
+
+    def bind_write_item(self, command, resolve):
+        """Bind WRITE-ITEM operation"""
+        # Example: WRITE-ITEM D
+        write_item = self.file_handler.write_item
+        file_letter = command.files[0]
+        
+        def run():
+            if not write_item(file_letter):
+                return self.fault(command)
+            return None
+        return run
 
-    def stop(self, command):
-        """Handle STOP operation"""
+    def bind_stop(self, command, resolve):
+        """Bind STOP operation"""
         # Example: STOP . (END)
-        self.running = False
-        print("Program execution stopped")
-        return 0
+        def run():
+            self.running = False
+            self.log.summary("Program execution stopped")
+            return HALT
+        return run
 
-    def test(self, command):
-        """Handle TEST operation"""
+    def bind_test(self, command, resolve):
+        """Bind TEST operation"""
         # Example: TEST PRODUCT-NO (B) AGAINST ZZZZZZZZZZZZ ; IF EQUAL GO TO OPERATION 16 ; OTHERWISE GO TO OPERATION 15
+        get_value = self.file_handler.field_getter(command.files[0], command.fields[0])
+        test_value = command.constant
+        labels = {
+            "EQUAL": "Test equal, branching to operation {}",
+            "GREATER": "Test greater, branching to operation {}",
+            "LESS": "Test less, branching to operation {}",
+            "OTHERWISE": "Test otherwise, branching to operation {}",
+        }
+        outcomes = self.branch_outcomes(command, resolve, ("EQUAL", "GREATER", "LESS"), labels)
+        on_equal, on_greater, on_less = outcomes["EQUAL"], outcomes["GREATER"], outcomes["LESS"]
         
-        # Extract the field and test value
-        match = re.search(r'TEST (\S+) \((\w+)\) AGAINST (\S+)', command)
-        if not match:
-            print(f"SYNTAX ERROR in TEST: {command}")
-            return -1
-            
-        field = match.group(1)
-        file_letter = match.group(2)
-        test_value = match.group(3)
-        
-        field_value = self.file_handler.get_field(file_letter, field)
-        if field_value is None:
-            return -1
-            
-        self.debug_print(f"Testing {field_value} against {test_value}")
-        
-        # Process conditions and branch accordingly
-        if "IF EQUAL GO TO OPERATION" in command and field_value == test_value:
-            match = re.search(r'IF EQUAL GO TO OPERATION (\d+)', command)
-            if match:
-                target_op = match.group(1)
-                self.debug_print(f"Test equal, branching to operation {target_op}")
-                self.current_operation_number = target_op
-                return 0
-                
-        if "IF GREATER GO TO OPERATION" in command and field_value > test_value:
-            match = re.search(r'IF GREATER GO TO OPERATION (\d+)', command)
-            if match:
-                target_op = match.group(1)
-                self.debug_print(f"Test greater, branching to operation {target_op}")
-                self.current_operation_number = target_op
-                return 0
+        def run():
+            field_value = get_value()
+            if field_value is None:
+                return self.fault(command)
                 
-        if "IF LESS GO TO OPERATION" in command and field_value < test_value:
-            match = re.search(r'IF LESS GO TO OPERATION (\d+)', command)
-            if match:
-                target_op = match.group(1)
-                self.debug_print(f"Test less, branching to operation {target_op}")
-                self.current_operation_number = target_op
-                return 0
-                
-        if "OTHERWISE GO TO OPERATION" in command:
-            match = re.search(r'OTHERWISE GO TO OPERATION (\d+)', command)
-            if match:
-                target_op = match.group(1)
-                self.debug_print(f"Test otherwise, branching to operation {target_op}")
-                self.current_operation_number = target_op
-                return 0
+            self.log.trace("Testing %s against %s", field_value, test_value)
+            
+            if field_value == test_value:
+                outcome = on_equal
+            elif field_value > test_value:
+                outcome = on_greater
+            else:
+                outcome = on_less
                 
-        return 0
+            if outcome is None:
+                return None
+            target, message = outcome
+            self.log.trace(message)
+            return target
+        return run
 
-    def set(self, command):
-        """Handle SET operation"""
+    def bind_set(self, command, resolve):
+        """Bind SET operation"""
         # Example: SET OPERATION 9 TO GO TO OPERATION 2
-        match = re.search(r'SET OPERATION (\d+) TO GO TO OPERATION (\d+)', command)
-        if not match:
-            print(f"SYNTAX ERROR in SET: {command}")
-            return -1
-            
-        from_op = match.group(1)
-        to_op = match.group(2)
+        from_op, to_op = command.constant
+        for op_num in (from_op, to_op):
+            if op_num not in self.operations:
+                def run(op_num=op_num):
+                    self.log.error("ERROR: OPERATION %s NOT IN OPERATIONS.", op_num)
+                    return self.fault(command)
+                return run
+                
+        successors = self.successors
+        from_index = self.op_index[from_op]
+        to_index = self.op_index[to_op]
+        message = f"Setting operation {from_op} to go to operation {to_op}"
         
-        if from_op not in self.operations:
-            print(f"ERROR: OPERATION {from_op} NOT IN OPERATIONS.")
-            return -1
-            
-        if to_op not in self.operations:
-            print(f"ERROR: OPERATION {to_op} NOT IN OPERATIONS.")
-            return -1
-            
-        self.debug_print(f"Setting operation {from_op} to go to operation {to_op}")
-        self.operation_pointers[from_op] = to_op
-        return 0
+        def run():
+            self.log.trace(message)
+            self.operation_pointers[from_op] = to_op
+            successors[from_index] = to_index
+            # Fused blocks running on through the rewired operation are rebuilt to follow it
+            heads = self.fused_through.get(from_index)
+            if heads:
+                for head in list(heads):
+                    self.fuse_block(head)
+            return None
+        return run
 
-    def move(self, command):
-        """Handle MOVE operation"""
+    def bind_move(self, command, resolve):
+        """Bind MOVE operation"""
         # Example: MOVE UNIT-PRICE (B) TO UNIT-PRICE (C)
-        match = re.search(r'MOVE (\S+) \((\w+)\) TO (\S+) \((\w+)\)', command)
-        if not match:
-            print(f"SYNTAX ERROR in MOVE: {command}")
-            return -1
-            
-        field1 = match.group(1)
-        file1 = match.group(2)
-        field2 = match.group(3)
-        file2 = match.group(4)
+        field1, field2 = command.fields
+        file1, file2 = command.files
+        get_value = self.file_handler.field_getter(file1, field1)
+        set_value = self.file_handler.field_setter(file2, field2)
         
-        value = self.file_handler.get_field(file1, field1)
-        if value is None:
-            return -1
-            
-        self.debug_print(f"Moving value {value} from {field1}({file1}) to {field2}({file2})")
-        self.file_handler.set_field(file2, field2, value)
-        return 0
+        def run():
+            value = get_value()
+            if value is None:
+                return self.fault(command)
+                
+            self.log.trace("Moving value %s from %s(%s) to %s(%s)", value, field1, file1, field2, file2)
+            set_value(value)
+            return None
+        return run
 
-    def rewind(self, command):
-        """Handle REWIND operation"""
+    def bind_rewind(self, command, resolve):
+        """Bind REWIND operation"""
         # Example: REWIND B
-        match = re.search(r'REWIND (\w+)', command)
-        if not match:
-            print(f"SYNTAX ERROR in REWIND: {command}")
-            return -1
-            
-        file_letter = match.group(1)
-        if not self.file_handler.rewind(file_letter):
-            return -1
-            
-        return 0
+        rewind = self.file_handler.rewind
+        file_letter = command.files[0]
+        
+        def run():
+            if not rewind(file_letter):
+                return self.fault(command)
+            return None
+        return run
 
-    def close_out(self, command):
-        """Handle CLOSE-OUT operation"""
-        # Example: CLOSE-OUT FILES C , D
-        match = re.search(r'CLOSE-OUT FILES? ([\w ,]+)', command)
-        if not match:
-            print(f"SYNTAX ERROR in CLOSE-OUT: {command}")
-            return -1
-            
-        file_list = match.group(1)
-        file_letters = [letter.strip() for letter in file_list.split(',')]
+    def bind_sort(self, command, resolve):
+        """Bind SORT operation"""
+        # Example: SORT B ON PRODUCT-NO , UNIT-PRICE
+        sort_file = self.file_handler.sort_file
+        file_letter = command.files[0]
+        fields = command.fields
         
-        self.file_handler.close_out(file_letters)
-        return 0
+        def run():
+            if not sort_file(file_letter, fields):
+                return self.fault(command)
+            return None
+        return run
 
-    def add(self, command):
-        """Handle ADD operation"""
-        # Example: ADD QUANTITY (A) TO STORED QUANTITY (W)
-        match = re.search(r'ADD (\S+) \((\w+)\) TO (\S+) \((\w+)\)', command)
-        if not match:
-            print(f"SYNTAX ERROR in ADD: {command}")
-            return -1
-            
-        field1 = match.group(1)
-        file1 = match.group(2)
-        field2 = match.group(3)
-        file2 = match.group(4)
+    def bind_close_out(self, command, resolve):
+        """Bind CLOSE-OUT operation"""
+        # Example: CLOSE-OUT FILES C , D
+        close_out = self.file_handler.close_out
+        file_letters = command.files
         
-        val1 = self.file_handler.get_field(file1, field1)
-        val2 = self.file_handler.get_field(file2, field2)
+        def run():
+            if not close_out(file_letters):
+                return self.fault(command)
+            return None
+        return run
+
+    def bind_arithmetic(self, command, compute):
+        """Bind an arithmetic operation around its compute function"""
+        file_handler = self.file_handler
+        get_value1 = file_handler.field_getter(command.files[0], command.fields[0])
+        get_value2 = file_handler.field_getter(command.files[1], command.fields[1])
+        # ADD and SUBTRACT store into their second operand, MULTIPLY and DIVIDE name a result
+        set_result = file_handler.field_setter(command.files[-1], command.fields[-1])
         
-        if val1 is None or val2 is None:
-            return -1
+        def run():
+            val1 = get_value1()
+            val2 = get_value2()
             
-        # Convert to numbers for addition
-        try:
-            result = float(val1) + float(val2)
-            # Convert back to same format as original
-            if '.' not in val2:
-                result = int(result)
-            self.debug_print(f"Adding {val1} to {val2}, result: {result}")
-            self.file_handler.set_field(file2, field2, str(result))
-            return 0
-        except ValueError:
-            print(f"ERROR: Cannot convert values to numbers for addition: {val1}, {val2}")
-            return -1
-
-    def subtract(self, command):
-        """Handle SUBTRACT operation"""
+            if val1 is None or val2 is None:
+                return self.fault(command)
+                
+            result = compute(val1, val2)
+            if result is None:
+                return self.fault(command)
+            set_result(result)
+            return None
+        return run
+
+    def bind_add(self, command, resolve):
+        """Bind ADD operation"""
+        # Example: ADD QUANTITY (A) TO STORED QUANTITY (W)
+        return self.bind_arithmetic(command, self.add_values)
+
+    def bind_subtract(self, command, resolve):
+        """Bind SUBTRACT operation"""
         # Example: SUBTRACT X (A) FROM Y (B)
-        match = re.search(r'SUBTRACT (\S+) \((\w+)\) FROM (\S+) \((\w+)\)', command)
-        if not match:
-            print(f"SYNTAX ERROR in SUBTRACT: {command}")
-            return -1
-            
-        field1 = match.group(1)
-        file1 = match.group(2)
-        field2 = match.group(3)
-        file2 = match.group(4)
-        
-        val1 = self.file_handler.get_field(file1, field1)
-        val2 = self.file_handler.get_field(file2, field2)
-        
-        if val1 is None or val2 is None:
-            return -1
-            
-        try:
-            result = float(val2) - float(val1)
-            if '.' not in val2:
-                result = int(result)
-            self.debug_print(f"Subtracting {val1} from {val2}, result: {result}")
-            self.file_handler.set_field(file2, field2, str(result))
-            return 0
-
-        except ValueError:
-            print(f"ERROR: Cannot convert values to numbers for multiplication: {val1}, {val2}")
-            return -1
-
-    def multiply(self, command):
-        """Handle MULTIPLY operation"""
+        return self.bind_arithmetic(command, self.subtract_values)
+
+    def bind_multiply(self, command, resolve):
+        """Bind MULTIPLY operation"""
         # Example: MULTIPLY QUANTITY (C) BY UNIT-PRICE (C) GIVING EXTENDED-PRICE (C)
-        match = re.search(r'MULTIPLY (\S+) \((\w+)\) BY (\S+) \((\w+)\) GIVING (\S+) \((\w+)\)', command)
-        if not match:
-            print(f"SYNTAX ERROR in MULTIPLY: {command}")
-            return -1
-            
-        field1 = match.group(1)
-        file1 = match.group(2)
-        field2 = match.group(3)
-        file2 = match.group(4)
-        result_field = match.group(5)
-        result_file = match.group(6)
-        
-        val1 = self.file_handler.get_field(file1, field1)
-        val2 = self.file_handler.get_field(file2, field2)
-        
-        if val1 is None or val2 is None:
-            return -1
-            
-        try:
-            result = float(val1) * float(val2)
-            # Format result based on inputs
-            if '.' not in val1 and '.' not in val2:
-                result = int(result)
-            self.file_handler.set_field(result_file, result_field, str(result))
-            return 0
-        except ValueError:
-            print(f"ERROR: Cannot convert values to numbers for multiplication: {val1}, {val2}")
-            return -1
-
-    def divide(self, command):
-        """Handle DIVIDE operation"""
+        return self.bind_arithmetic(command, self.multiply_values)
+
+    def bind_divide(self, command, resolve):
+        """Bind DIVIDE operation"""
         # Example: DIVIDE TOTAL (A) BY COUNT (A) GIVING AVERAGE (A)
-        match = re.search(r'DIVIDE (\S+) \((\w+)\) BY (\S+) \((\w+)\) GIVING (\S+) \((\w+)\)', command)
-        if not match:
-            print(f"SYNTAX ERROR in DIVIDE: {command}")
-            return -1
-            
-        field1 = match.group(1)
-        file1 = match.group(2)
-        field2 = match.group(3)
-        file2 = match.group(4)
-        result_field = match.group(5)
-        result_file = match.group(6)
+        return self.bind_arithmetic(command, self.divide_values)
+
+    def numbers(self, val1, val2, verb):
+        """Return two field values as FixedPoint numbers, or None if either is not a number"""
+        number1 = val1 if val1.__class__ is FixedPoint else FixedPoint.parse(val1)
+        number2 = val2 if val2.__class__ is FixedPoint else FixedPoint.parse(val2)
+        if number1 is None or number2 is None:
+            self.log.error("ERROR: Cannot convert values to numbers for %s: %s, %s", verb, val1, val2)
+            return None
+        return number1, number2
+
+    def add_values(self, val1, val2):
+        """Compute ADD, returning None if the values are not numbers
+
+        The sum keeps the format of the field added to: its decimal places
+        and its width. Added to a whole number, the exact sum is truncated
+        toward zero.
+        """
+        if val2.__class__ is FixedPoint and not val2.scale and val1.__class__ is str and val1.isdecimal():
+            # Accumulating a whole number read from a record, the common case
+            result = FixedPoint(val2.units + int(val1), 0, val2.width)
+            if self.log.show_trace:
+                self.log.trace("Adding %s to %s, result: %s", val1, val2, result)
+            return result
+        numbers = self.numbers(val1, val2, "addition")
+        if numbers is None:
+            return None
+        number1, number2 = numbers
+        if number1.scale == number2.scale:
+            result = FixedPoint(number2.units + number1.units, number2.scale, number2.width)
+        else:
+            scale = max(number1.scale, number2.scale)
+            result = FixedPoint(number2.rescale(scale) + number1.rescale(scale), scale, number2.width)
+            if not number2.scale:
+                result = FixedPoint(result.rescale(0), 0, number2.width)
+        if self.log.show_trace:
+            self.log.trace("Adding %s to %s, result: %s", val1, val2, result)
+        return result
+
+    def subtract_values(self, val1, val2):
+        """Compute SUBTRACT, returning None if the values are not numbers, in the format of the field subtracted from"""
+        if val2.__class__ is FixedPoint and not val2.scale and val1.__class__ is str and val1.isdecimal():
+            # Accumulating a whole number read from a record, the common case
+            result = FixedPoint(val2.units - int(val1), 0, val2.width)
+            if self.log.show_trace:
+                self.log.trace("Subtracting %s from %s, result: %s", val1, val2, result)
+            return result
+        numbers = self.numbers(val1, val2, "subtraction")
+        if numbers is None:
+            return None
+        number1, number2 = numbers
+        if number1.scale == number2.scale:
+            result = FixedPoint(number2.units - number1.units, number2.scale, number2.width)
+        else:
+            scale = max(number1.scale, number2.scale)
+            result = FixedPoint(number2.rescale(scale) - number1.rescale(scale), scale, number2.width)
+            if not number2.scale:
+                result = FixedPoint(result.rescale(0), 0, number2.width)
+        if self.log.show_trace:
+            self.log.trace("Subtracting %s from %s, result: %s", val1, val2, result)
+        return result
+
+    def multiply_values(self, val1, val2):
+        """Compute MULTIPLY exactly, returning None if the values are not numbers"""
+        if val1.__class__ is str and val2.__class__ is str and val1.isdecimal() and val2.isdecimal():
+            # Whole numbers read from records, the common case
+            width1 = len(val1) if val1[0] == '0' and len(val1) > 1 else 0
+            width2 = len(val2) if val2[0] == '0' and len(val2) > 1 else 0
+            return FixedPoint(int(val1) * int(val2), 0, max(width1, width2))
+        numbers = self.numbers(val1, val2, "multiplication")
+        if numbers is None:
+            return None
+        number1, number2 = numbers
+        return FixedPoint(number1.units * number2.units, number1.scale + number2.scale,
+                          max(number1.width, number2.width))
+
+    def divide_values(self, val1, val2):
+        """Compute DIVIDE to at least DIVIDE_SCALE decimal places, rounding half away from zero,
+        returning None if the values are not numbers"""
+        numbers = self.numbers(val1, val2, "division")
+        if numbers is None:
+            return None
+        number1, number2 = numbers
+        if number2.units == 0:
+            self.log.error("ERROR: Division by zero")
+            return None
+        scale = max(number1.scale, number2.scale, DIVIDE_SCALE)
+        # units1 / 10**s1 / (units2 / 10**s2), expressed in units of 10**-scale
+        numerator = abs(number1.units) * 10 ** (scale + number2.scale)
+        denominator = abs(number2.units) * 10 ** number1.scale
+        units, remainder = divmod(numerator, denominator)
+        if 2 * remainder >= denominator:
+            units += 1
+        if (number1.units < 0) != (number2.units < 0):
+            units = -units
+        return FixedPoint(units, scale, max(number1.width, number2.width))
+
+    # Handler for each opcode, bound once per operation by bind_program
+    BINDERS = {
+        "INPUT": bind_input,
+        "OUTPUT": bind_output,
+        "COMPARE": bind_compare,
+        "READ-ITEM": bind_read_item,
+        "WRITE-ITEM": bind_write_item,
+        "TRANSFER": bind_transfer,
+        "MOVE": bind_move,
+        "JUMP": bind_jump,
+        "STOP": bind_stop,
+        "TEST": bind_test,
+        "SET": bind_set,
+        "REWIND": bind_rewind,
+        "SORT": bind_sort,
+        "CLOSE-OUT": bind_close_out,
+        "ADD": bind_add,
+        "SUBTRACT": bind_subtract,
+        "MULTIPLY": bind_multiply,
+        "DIVIDE": bind_divide,
+        "IF": bind_conditional,
+        "OTHERWISE": bind_otherwise,
+        "NOP": bind_nop,
+    }
+
+class FlowmaticCompiler:
+    """Translates a parsed FLOW-MATIC program into a single Python function"""
+
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.operations = interpreter.operations
+        self.pointers = interpreter.operation_pointers
+        self.log = interpreter.log
+        self.pacing = interpreter.pacing
+        self.lines = []
+
+    def emit(self, depth, line):
+        """Append a line of generated code"""
+        self.lines.append("    " * depth + line)
+
+    def emit_print(self, depth, message):
+        """Generate a print of a fixed message"""
+        self.emit(depth, f"print({message!r}, file=log_file)")
+
+    def emit_error(self, depth, message):
+        """Generate a print of a fixed error message when errors are shown"""
+        if self.log.show_errors:
+            self.emit_print(depth, message)
+
+    def emit_summary(self, depth, message):
+        """Generate a print of a fixed message when the summary is shown"""
+        if self.log.show_summary:
+            self.emit_print(depth, message)
+
+    def emit_trace(self, depth, message):
+        """Generate a print of a fixed message when every step is traced"""
+        if self.log.show_trace:
+            self.emit_print(depth, message)
+
+    def generate(self):
+        """Generate the Python source of the compiled program"""
+        operations = self.operations
+        self.slots = {op_num: slot for slot, op_num in enumerate(sorted(operations, key=int))}
         
-        val1 = self.file_handler.get_field(file1, field1)
-        val2 = self.file_handler.get_field(file2, field2)
+        # Operations whose successor a SET can rewrite keep it in a local variable
+        self.rewired = {}
+        entries = {"0"}
+        for instruction in operations.values():
+            for command in (instruction,) + instruction.clauses:
+                if command.error is not None:
+                    continue
+                entries.update(target for target in command.targets.values() if target in operations)
+                if command.opcode == "SET":
+                    from_op, to_op = command.constant
+                    if from_op in operations and to_op in operations:
+                        self.rewired[from_op] = f"next_{from_op}"
+                        entries.add(to_op)
+        for op_num in self.rewired:
+            if self.pointers.get(op_num) is not None:
+                entries.add(self.pointers[op_num])
+        self.entries = sorted(entries, key=int)
         
-        if val1 is None or val2 is None:
-            return -1
+        self.lines = []
+        self.accessors = {}
+        self.emit(0, "def run_program(interp):")
+        self.emit(1, "file_handler = interp.file_handler")
+        accessors_at = len(self.lines)
+        for method in ("read_item", "write_item", "transfer_item", "rewind", "sort_file", "close_out"):
+            self.emit(1, f"{method} = file_handler.{method}")
+        self.emit(1, "end_of_data = file_handler.end_of_data")
+        for method in ("add_values", "subtract_values", "multiply_values", "divide_values"):
+            self.emit(1, f"{method} = interp.{method}")
+        self.emit(1, "pointers = interp.operation_pointers")
+        for op_num, name in self.rewired.items():
+            self.emit(1, f"{name} = SLOTS.get(pointers.get({op_num!r}), END_OF_PROGRAM)")
+        self.emit(1, "status = interp.compare_status")
+        self.emit(1, f"pc = {self.slots['0']}")
+        self.emit(1, "steps = 0")
+        self.emit(1, "clock = 0")
+        self.emit(1, "try:")
+        self.emit(2, "while True:")
+        self.emit_dispatch(self.entries, 3)
+        self.emit(3, "raise RuntimeError(f'No compiled block for slot {pc}')")
+        self.emit(1, "finally:")
+        self.emit(2, "interp.compare_status = status")
+        self.emit(2, "interp.steps_executed = steps")
+        self.emit(2, "interp.simulated_time = clock / 1000000")
+        self.emit(2, "interp.running = False")
+        # Field accessors are bound once, ahead of the loop
+        self.lines[accessors_at:accessors_at] = [
+            f"    {name} = file_handler.{kind}({file_letter!r}, {field!r})"
+            for (kind, file_letter, field), name in self.accessors.items()
+        ]
+        return "\n".join(self.lines) + "\n"
+
+    def compile(self):
+        """Compile the program into a callable taking the interpreter"""
+        source = self.generate()
+        namespace = {
+            "SLOTS": dict(self.slots),
+            "HALT": HALT,
+            "FAULT": FAULT,
+            "END_OF_PROGRAM": END_OF_PROGRAM,
+            "NO_NEXT_OPERATION": NO_NEXT_OPERATION,
+            "sleep": time.sleep,
+            "REALTIME_DELAY": REALTIME_DELAY,
+            "log_file": self.log.file,
+        }
+        exec(compile(source, "<flowmatic program>", "exec"), namespace)
+        return namespace["run_program"]
+
+    def emit_dispatch(self, entries, depth):
+        """Generate a binary search over the block entry slots"""
+        if len(entries) == 1:
+            self.emit_block(entries[0], depth)
+            return
+        if len(entries) == 2:
+            self.emit(depth, f"if pc == {self.slots[entries[0]]}:")
+            self.emit_block(entries[0], depth + 1)
+            self.emit_block(entries[1], depth)
+            return
             
-        try:
-            divisor = float(val2)
-            if divisor == 0:
-                print("ERROR: Division by zero")
-                return -1
+        middle = len(entries) // 2
+        self.emit(depth, f"if pc < {self.slots[entries[middle]]}:")
+        self.emit_dispatch(entries[:middle], depth + 1)
+        self.emit_dispatch(entries[middle:], depth)
+
+    def emit_block(self, op_num, depth):
+        """Generate straight-line code from an entry operation to the next transfer of control"""
+        while True:
+            if self.emit_operation(op_num, depth):
+                return
                 
-            result = float(val1) / divisor
-            self.file_handler.set_field(result_file, result_field, str(result))
-            return 0
-        except ValueError:
-            print(f"ERROR: Cannot convert values to numbers for division: {val1}, {val2}")
-            return -1
+            if op_num in self.rewired:
+                # A SET may have redirected this operation at run time
+                name = self.rewired[op_num]
+                if self.pointers.get(op_num) is None:
+                    self.emit(depth, f"if {name} == END_OF_PROGRAM:")
+                    self.emit(depth + 1, f"return END_OF_PROGRAM, {op_num!r}")
+                self.emit(depth, f"pc = {name}")
+                self.emit(depth, "continue")
+                return
+            if op_num not in self.pointers:
+                self.emit(depth, f"return NO_NEXT_OPERATION, {op_num!r}")
+                return
+            next_op = self.pointers[op_num]
+            if next_op is None:
+                self.emit(depth, f"return END_OF_PROGRAM, {op_num!r}")
+                return
+            if next_op in self.entries:
+                self.emit(depth, f"pc = {self.slots[next_op]}")
+                self.emit(depth, "continue")
+                return
+            op_num = next_op
 
-if __name__ == "__main__":
-    # Check if file path was provided
-    if len(sys.argv) < 2:
-        print("Usage: python flowmatic.py <program_file>")
+    def emit_operation(self, op_num, depth):
+        """Generate one operation, returning True if it always transfers control"""
+        instruction = self.operations[op_num]
+        self.emit(depth, f"# ({op_num}) {instruction.text}")
+        self.emit(depth, "steps += 1")
+        if self.pacing == "realtime":
+            self.emit(depth, "sleep(REALTIME_DELAY)")
+        elif self.pacing == "virtual":
+            self.emit(depth, f"clock += {self.interpreter.operation_cost(instruction)}")
+        self.emit_trace(depth, f"Executing operation {op_num}")
+        for command in (instruction,) + instruction.clauses:
+            self.emit_trace(depth, f"Executing: {command.text}")
+            if command.error is not None:
+                self.emit_error(depth, command.error)
+                self.emit_fault(command, depth)
+                return True
+            emitter = self.EMITTERS.get(command.opcode, FlowmaticCompiler.emit_unknown)
+            if emitter(self, command, depth):
+                return True
+        return False
+
+    def emit_goto(self, command, target_op, depth):
+        """Generate a branch, returning True if control leaves the operation"""
+        if target_op == command.number:
+            # Branching to the operation itself just carries on with it
+            self.emit(depth, "pass")
+            return False
+        self.emit_trace(depth, f"Branched from operation {command.number} to {target_op}")
+        if target_op in self.operations:
+            self.emit(depth, f"pc = {self.slots[target_op]}")
+            self.emit(depth, "continue")
+        else:
+            self.emit(depth, "steps += 1")
+            self.emit_error(depth, f"ERROR: Operation {target_op} not found")
+            self.emit(depth, f"return FAULT, {target_op!r}")
+        return True
+
+    def emit_fault(self, command, depth):
+        """Generate the report of a failed command"""
+        self.emit_error(depth, f"ERROR in operation ({command.number}): {command.text}")
+        self.emit(depth, f"return FAULT, {command.number!r}")
+
+    def emit_checked(self, command, call, depth):
+        """Generate a file handler call that fails the operation when it returns False"""
+        self.emit(depth, f"if not {call}:")
+        self.emit_fault(command, depth + 1)
+        return False
+
+    def accessor(self, kind, file_letter, field):
+        """Name the prologue variable holding a field getter or setter"""
+        key = (kind, file_letter, field)
+        if key not in self.accessors:
+            prefix = "get" if kind == "field_getter" else "put"
+            self.accessors[key] = f"{prefix}_{len(self.accessors)}"
+        return self.accessors[key]
+
+    def emit_fields(self, command, depth, count=None):
+        """Generate fetches of the field operands into v1, v2, ..."""
+        operands = list(zip(command.files, command.fields))[:count]
+        names = [f"v{i + 1}" for i in range(len(operands))]
+        for name, (file_letter, field) in zip(names, operands):
+            self.emit(depth, f"{name} = {self.accessor('field_getter', file_letter, field)}()")
+        self.emit(depth, f"if {' or '.join(name + ' is None' for name in names)}:")
+        self.emit_fault(command, depth + 1)
+
+    def emit_outcome(self, command, outcome, depth):
+        """Generate the branch taken for one comparison result"""
+        if outcome is None:
+            self.emit(depth, "pass")
+        else:
+            self.emit_goto(command, outcome, depth)
+
+    def outcomes(self, command, conditions):
+        """Pick the target for each comparison result, falling back to OTHERWISE"""
+        targets = command.targets
+        return [targets.get(condition, targets.get("OTHERWISE")) for condition in conditions]
+
+    def emit_input(self, command, depth):
+        for file_name, file_letter in zip(command.constant, command.files):
+            self.emit(depth, f"file_handler.register_file({file_letter!r}, {file_name!r})")
+            self.emit(depth, f"file_handler.load_file({file_letter!r}, "
+                             f"file_handler.input_file({file_name!r}, {file_letter!r}))")
+        return False
+
+    def emit_output(self, command, depth):
+        for file_name, file_letter in zip(command.constant, command.files):
+            self.emit(depth, f"file_handler.register_file({file_letter!r}, {file_name!r}, is_output=True)")
+        return False
+
+    def emit_read_item(self, command, depth):
+        file_letter = command.files[0]
+        if "END OF DATA" in command.targets:
+            self.emit(depth, f"read = read_item({file_letter!r})")
+            self.emit(depth, "if read is None:")
+            self.emit_fault(command, depth + 1)
+            self.emit(depth, "if not read:")
+            self.emit_goto(command, command.targets["END OF DATA"], depth + 1)
+        else:
+            self.emit(depth, f"if read_item({file_letter!r}) is None:")
+            self.emit_fault(command, depth + 1)
+        return False
+
+    def emit_write_item(self, command, depth):
+        return self.emit_checked(command, f"write_item({command.files[0]!r})", depth)
+
+    def emit_transfer(self, command, depth):
+        return self.emit_checked(command, f"transfer_item({command.files[0]!r}, {command.files[1]!r})", depth)
+
+    def emit_rewind(self, command, depth):
+        return self.emit_checked(command, f"rewind({command.files[0]!r})", depth)
+
+    def emit_sort(self, command, depth):
+        return self.emit_checked(command, f"sort_file({command.files[0]!r}, {command.fields!r})", depth)
+
+    def emit_close_out(self, command, depth):
+        return self.emit_checked(command, f"close_out({command.files!r})", depth)
+
+    def emit_move(self, command, depth):
+        self.emit_fields(command, depth, 1)
+        self.emit(depth, f"{self.accessor('field_setter', command.files[1], command.fields[1])}(v1)")
+        return False
+
+    def emit_compare(self, command, depth):
+        on_greater, on_equal, on_less = self.outcomes(command, ("GREATER", "EQUAL", "LESS"))
+        self.emit_fields(command, depth)
+        self.emit(depth, "if v1 > v2:")
+        self.emit(depth + 1, "status = 'GREATER'")
+        self.emit_outcome(command, on_greater, depth + 1)
+        self.emit(depth, "elif v1 == v2:")
+        self.emit(depth + 1, "status = 'EQUAL'")
+        self.emit_outcome(command, on_equal, depth + 1)
+        self.emit(depth, "else:")
+        self.emit(depth + 1, "status = 'LESS'")
+        self.emit_outcome(command, on_less, depth + 1)
+        return None not in (on_greater, on_equal, on_less) and command.number not in (on_greater, on_equal, on_less)
+
+    def emit_test(self, command, depth):
+        on_equal, on_greater, on_less = self.outcomes(command, ("EQUAL", "GREATER", "LESS"))
+        self.emit_fields(command, depth)
+        self.emit(depth, f"if v1 == {command.constant!r}:")
+        self.emit_outcome(command, on_equal, depth + 1)
+        self.emit(depth, f"elif v1 > {command.constant!r}:")
+        self.emit_outcome(command, on_greater, depth + 1)
+        self.emit(depth, "else:")
+        self.emit_outcome(command, on_less, depth + 1)
+        return None not in (on_greater, on_equal, on_less) and command.number not in (on_greater, on_equal, on_less)
+
+    def emit_conditional(self, command, depth):
+        condition = command.constant
+        if condition not in command.targets:
+            return False
+        target_op = command.targets[condition]
+        if condition == "OTHERWISE":
+            return self.emit_goto(command, target_op, depth)
+        if condition == "END OF DATA":
+            self.emit(depth, "if True in end_of_data.values():")
+        else:
+            self.emit(depth, f"if status == {condition!r}:")
+        self.emit_goto(command, target_op, depth + 1)
+        return False
+
+    def emit_jump(self, command, depth):
+        jump_op = command.targets["JUMP"]
+        if jump_op not in self.operations:
+            self.emit_error(depth, f"ERROR: OPERATION {jump_op} NOT IN OPERATIONS.")
+            self.emit_fault(command, depth)
+            return True
+        return self.emit_goto(command, jump_op, depth)
+
+    def emit_set(self, command, depth):
+        from_op, to_op = command.constant
+        for op_num in (from_op, to_op):
+            if op_num not in self.operations:
+                self.emit_error(depth, f"ERROR: OPERATION {op_num} NOT IN OPERATIONS.")
+                self.emit_fault(command, depth)
+                return True
+        self.emit(depth, f"pointers[{from_op!r}] = {to_op!r}")
+        self.emit(depth, f"{self.rewired[from_op]} = {self.slots[to_op]}")
+        return False
+
+    def emit_stop(self, command, depth):
+        self.emit_summary(depth, "Program execution stopped")
+        self.emit(depth, f"return HALT, {command.number!r}")
+        return True
+
+    def emit_arithmetic(self, command, depth):
+        compute = {
+            "ADD": "add_values",
+            "SUBTRACT": "subtract_values",
+            "MULTIPLY": "multiply_values",
+            "DIVIDE": "divide_values",
+        }[command.opcode]
+        self.emit_fields(command, depth, 2)
+        self.emit(depth, f"result = {compute}(v1, v2)")
+        self.emit(depth, "if result is None:")
+        self.emit_fault(command, depth + 1)
+        self.emit(depth, f"{self.accessor('field_setter', command.files[-1], command.fields[-1])}(result)")
+        return False
+
+    def emit_nothing(self, command, depth):
+        return False
+
+    def emit_unknown(self, command, depth):
+        self.emit_error(depth, f"UNKNOWN COMMAND: {command.text} --- HALTED.")
+        self.emit_fault(command, depth)
+        return True
+
+    # Code generator for each opcode
+    EMITTERS = {
+        "INPUT": emit_input,
+        "OUTPUT": emit_output,
+        "COMPARE": emit_compare,
+        "READ-ITEM": emit_read_item,
+        "WRITE-ITEM": emit_write_item,
+        "TRANSFER": emit_transfer,
+        "MOVE": emit_move,
+        "JUMP": emit_jump,
+        "STOP": emit_stop,
+        "TEST": emit_test,
+        "SET": emit_set,
+        "REWIND": emit_rewind,
+        "SORT": emit_sort,
+        "CLOSE-OUT": emit_close_out,
+        "ADD": emit_arithmetic,
+        "SUBTRACT": emit_arithmetic,
+        "MULTIPLY": emit_arithmetic,
+        "DIVIDE": emit_arithmetic,
+        "IF": emit_conditional,
+        "OTHERWISE": emit_nothing,
+        "NOP": emit_nothing,
+    }
+
+
+def report_run(interpreter):
+    """Report how many operations a run executed and how many records it moved"""
+    log = interpreter.log
+    log.summary("Executed %s operations in %.3f s (%.0f ops/sec)",
+                interpreter.steps_executed, interpreter.elapsed_time, interpreter.ops_per_second)
+    log.summary("Read %s records and wrote %s records",
+                interpreter.file_handler.records_read, interpreter.file_handler.records_written)
+
+
+def load_manifest(manifest_file, section="jobs"):
+    """Read a batch or pipeline manifest into a list of jobs
+
+    The manifest is a JSON object whose "jobs" (or, for a pipeline,
+    "stages") list holds one object per program run: its "program", the
+    "input" directory its INPUT files are read from, the "output"
+    directory its output files and log go to, and optionally its "name",
+    "pacing", "log_level", "input_mode", "output_format", the "codecs"
+    bound to its file letters, whether to run it on "uniservo" units and
+    whether to "compile" it. Paths are relative to the manifest.
+    """
+    with open(manifest_file) as f:
+        manifest = json.load(f)
+    base = os.path.dirname(os.path.abspath(manifest_file))
+    jobs = []
+    names = set()
+    for number, entry in enumerate(manifest.get(section, []), 1):
+        if "program" not in entry:
+            raise ValueError(f"job {number} names no program")
+        program = os.path.join(base, entry["program"])
+        name = entry.get("name") or os.path.splitext(os.path.basename(program))[0]
+        if name in names:
+            raise ValueError(f"job {number} repeats the name {name}")
+        names.add(name)
+        unknown = [codec for codec in [entry.get("output_format", "text")] + list(entry.get("codecs", {}).values())
+                   if codec not in CODECS]
+        if unknown:
+            raise ValueError(f"job {number} names unknown codecs {', '.join(unknown)}")
+        input_mode = entry.get("input_mode", "stream")
+        if input_mode not in INPUT_MODES:
+            raise ValueError(f"job {number} names unknown input mode {input_mode}")
+        if input_mode == "shared" and fcntl is None:
+            raise ValueError(f"job {number} reads shared input, which needs file locks this platform lacks")
+        input_directory = os.path.join(base, entry.get("input", "."))
+        jobs.append({
+            "name": name,
+            "program": program,
+            "input": input_directory,
+            "output": os.path.join(base, entry["output"]) if "output" in entry else input_directory,
+            "pacing": entry.get("pacing", "none"),
+            "log_level": entry.get("log_level", "summary"),
+            "compile": bool(entry.get("compile", False)),
+            "input_mode": input_mode,
+            "uniservo": bool(entry.get("uniservo", False)),
+            "output_format": entry.get("output_format", "text"),
+            "codecs": dict(entry.get("codecs", {})),
+        })
+    return jobs
+
+
+def prepare_job(job, log):
+    """Load and parse the program of a job into an interpreter set up as the job says"""
+    with open(job["program"]) as f:
+        program_text = f.read()
+    interpreter = FlowmaticInterpreter(log)
+    interpreter.pacing = job["pacing"]
+    interpreter.file_handler.input_mode = job["input_mode"]
+    interpreter.file_handler.uniservo = job["uniservo"]
+    interpreter.file_handler.output_format = job["output_format"]
+    interpreter.file_handler.codecs = job["codecs"]
+    interpreter.file_handler.input_directory = job["input"]
+    interpreter.file_handler.output_directory = job["output"]
+    interpreter.parse_program(program_text)
+    return interpreter
+
+
+def run_prepared(job, interpreter, result):
+    """Run a prepared job, adding how it ended to its result"""
+    ok = interpreter.execute_compiled() if job["compile"] else interpreter.execute()
+    report_run(interpreter)
+    result.update({
+        "status": "ok" if ok else "failed",
+        "last_operation": interpreter.current_operation_number,
+        "operations": interpreter.steps_executed,
+        "records_read": interpreter.file_handler.records_read,
+        "records_written": interpreter.file_handler.records_written,
+    })
+
+
+def run_job(job):
+    """Run one batch job, logging to <name>.log in its output directory, and return its result"""
+    started = time.perf_counter()
+    result = {"name": job["name"], "program": job["program"], "status": "error"}
+    try:
+        os.makedirs(job["output"], exist_ok=True)
+        result["log"] = os.path.join(job["output"], f"{job['name']}.log")
+        with open(result["log"], 'w') as log_file, contextlib.redirect_stdout(log_file):
+            interpreter = None
+            try:
+                interpreter = prepare_job(job, Log(job["log_level"]))
+                run_prepared(job, interpreter, result)
+            except Exception as e:
+                print(f"ERROR running {job['program']}: {e}")
+                result["error"] = str(e)
+                if interpreter is not None:
+                    # The worker lives on, so detach from shared input it would otherwise hold
+                    interpreter.file_handler.close_files()
+    except OSError as e:
+        result["error"] = str(e)
+    result["seconds"] = round(time.perf_counter() - started, 6)
+    return result
+
+
+def report_results(log, results):
+    """Report the result of each job of a batch or stage of a pipeline, returning how many did not succeed"""
+    for result in results:
+        if result["status"] == "error":
+            log.error("%-24s error   %s", result["name"], result.get("error"))
+        else:
+            log.summary("%-24s %-7s %10.3f s %12s operations %10s records read %10s written",
+                        result["name"], result["status"], result["seconds"], result["operations"],
+                        result["records_read"], result["records_written"])
+    return sum(result["status"] != "ok" for result in results)
+
+
+def write_summary(log, summary_file, summary):
+    """Write the results of a batch or pipeline to a JSON file"""
+    try:
+        with open(summary_file, 'w') as f:
+            json.dump(summary, f, indent=2)
+            f.write("\n")
+    except OSError as e:
+        log.error("ERROR writing summary %s: %s", summary_file, e)
+
+
+def batch_main(argv):
+    """Command line for running the jobs of a manifest in parallel"""
+    parser = argparse.ArgumentParser(prog="flowmatic.py batch",
+                                     description="Run the FLOW-MATIC jobs of a manifest across a process pool")
+    parser.add_argument("manifest", help="JSON manifest listing the jobs to run")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, metavar="N",
+                        help="jobs to run at once (default: the number of CPUs)")
+    parser.add_argument("--summary", metavar="FILE", help="also write the results of the jobs to FILE as JSON")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, default="summary",
+                        help="how much to print (default: summary)")
+    args = parser.parse_args(argv)
+    log = Log(args.log_level)
+    try:
+        jobs = load_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        log.error("ERROR reading manifest %s: %s", args.manifest, e)
+        sys.exit(1)
+    
+    started = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=max(args.jobs, 1)) as pool:
+        futures = [pool.submit(run_job, job) for job in jobs]
+        for job, future in zip(jobs, futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # The worker itself died
+                result = {"name": job["name"], "program": job["program"], "status": "error", "error": str(e)}
+            results.append(result)
+    elapsed = time.perf_counter() - started
+    
+    failed = report_results(log, results)
+    log.summary("Ran %s jobs in %.3f s with %s workers: %s ok, %s failed",
+                len(results), elapsed, max(args.jobs, 1), len(results) - failed, failed)
+    if args.summary:
+        write_summary(log, args.summary, {"seconds": round(elapsed, 6), "workers": max(args.jobs, 1), "jobs": results})
+    sys.exit(1 if failed else 0)
+
+
+def stage_files(interpreter):
+    """Return the file names a parsed program reads and writes, each with its file letter, and the letters it rewinds"""
+    inputs = {}
+    outputs = {}
+    rewound = set()
+    for instruction in interpreter.operations.values():
+        for command in (instruction,) + instruction.clauses:
+            if command.error is not None:
+                continue  # A syntax error, reported when the stage runs it
+            if command.opcode == "INPUT":
+                inputs.update(zip(command.constant, command.files))
+            elif command.opcode == "OUTPUT":
+                outputs.update(zip(command.constant, command.files))
+            elif command.opcode == "REWIND":
+                rewound.update(command.files)
+    return inputs, outputs, rewound
+
+
+def connect_stages(stages, interpreters, depth=PIPE_DEPTH):
+    """Stream each file a stage writes to the later stages that read it, returning (writer, name, reader) links
+
+    A file a stage rewinds cannot stream and is an error; a file no later
+    stage reads is written out as usual.
+    """
+    writers = {}  # Stage that last wrote each file name so far, and its interpreter
+    links = []
+    for stage, interpreter in zip(stages, interpreters):
+        inputs, outputs, rewound = stage_files(interpreter)
+        for name, letter in inputs.items():
+            if name not in writers:
+                continue
+            writer, writer_interpreter = writers[name]
+            if letter in rewound:
+                raise ValueError(f"stage {stage['name']} rewinds {name}, which streams from stage {writer['name']}")
+            pipe = Pipe(name, depth)
+            interpreter.file_handler.input_pipes[name] = pipe
+            writer_interpreter.file_handler.output_pipes.setdefault(name, []).append(pipe)
+            links.append((writer["name"], name, stage["name"]))
+        for name in outputs:
+            writers[name] = (stage, interpreter)
+    return links
+
+
+def run_stage(stage, interpreter, result):
+    """Run one pipeline stage in its thread, ending its pipes however it stops"""
+    started = time.perf_counter()
+    file_handler = interpreter.file_handler
+    try:
+        run_prepared(stage, interpreter, result)
+    except Exception as e:
+        interpreter.log.error("ERROR running %s: %s", stage["program"], e)
+        file_handler.close_files()
+        result["error"] = str(e)
+    finally:
+        # A stage that never opened a piped file must not leave the stage at its other end waiting
+        for pipe in file_handler.input_pipes.values():
+            pipe.close()
+        for pipes in file_handler.output_pipes.values():
+            for pipe in pipes:
+                pipe.end()
+        result["seconds"] = round(time.perf_counter() - started, 6)
+
+
+def pipeline_main(argv):
+    """Command line for running the stages of a pipeline together, streaming records between them"""
+    parser = argparse.ArgumentParser(prog="flowmatic.py pipeline",
+                                     description="Run FLOW-MATIC programs together, streaming each output file "
+                                                 "that a later program reads through memory instead of disk")
+    parser.add_argument("manifest", help="JSON manifest listing the stages in order")
+    parser.add_argument("--pipe-depth", type=int, default=PIPE_DEPTH, metavar="N",
+                        help=f"blocks of {PIPE_BLOCK} records a pipe holds before the stage writing it "
+                             "waits (default: %(default)s)")
+    parser.add_argument("--summary", metavar="FILE", help="also write the results of the stages to FILE as JSON")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, default="summary",
+                        help="how much to print (default: summary)")
+    args = parser.parse_args(argv)
+    log = Log(args.log_level)
+    log_files = []
+    try:
+        stages = load_manifest(args.manifest, "stages")
+        interpreters = []
+        for stage in stages:
+            os.makedirs(stage["output"], exist_ok=True)
+            log_files.append(open(os.path.join(stage["output"], f"{stage['name']}.log"), 'w'))
+            interpreters.append(prepare_job(stage, Log(stage["log_level"], log_files[-1])))
+        links = connect_stages(stages, interpreters, max(args.pipe_depth, 1))
+    except (OSError, ValueError) as e:
+        log.error("ERROR setting up pipeline %s: %s", args.manifest, e)
+        for log_file in log_files:
+            log_file.close()
+        sys.exit(1)
+    for writer, name, reader in links:
+        log.summary("Streaming %s from stage %s to stage %s", name, writer, reader)
+    
+    started = time.perf_counter()
+    results = [{"name": stage["name"], "program": stage["program"], "status": "error", "log": log_file.name}
+               for stage, log_file in zip(stages, log_files)]
+    threads = [threading.Thread(target=run_stage, args=stage_run, name=stage_run[0]["name"])
+               for stage_run in zip(stages, interpreters, results)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    for log_file in log_files:
+        log_file.close()
+    
+    failed = report_results(log, results)
+    log.summary("Ran %s stages in %.3f s, streaming %s files: %s ok, %s failed",
+                len(results), elapsed, len(links), len(results) - failed, failed)
+    if args.summary:
+        write_summary(log, args.summary, {"seconds": round(elapsed, 6), "links": [list(link) for link in links],
+                                          "stages": results})
+    sys.exit(1 if failed else 0)
+
+
+def convert_main(argv):
+    """Command line for converting between text data files and tape images"""
+    parser = argparse.ArgumentParser(prog="flowmatic.py convert",
+                                     description="Convert a text data file to a tape image, or a tape image to text")
+    parser.add_argument("source", help="data file or tape image to read")
+    parser.add_argument("destination", help="tape image or data file to write")
+    parser.add_argument("--layout", metavar="FILE",
+                        help="read the text data file as fixed-width records laid out by FILE")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, default="summary",
+                        help="how much to print (default: summary)")
+    args = parser.parse_args(argv)
+    log = Log(args.log_level)
+    try:
+        count = convert_file(args.source, args.destination, args.layout, log)
+    except Exception as e:
+        log.error("ERROR converting %s: %s", args.source, e)
         sys.exit(1)
+    log.summary("Converted %s records from %s to %s", count, args.source, args.destination)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["convert"]:
+        convert_main(sys.argv[2:])
+        sys.exit(0)
+    if sys.argv[1:2] == ["batch"]:
+        batch_main(sys.argv[2:])
+    if sys.argv[1:2] == ["pipeline"]:
+        pipeline_main(sys.argv[2:])
+    
+    parser = argparse.ArgumentParser(description="Run a FLOW-MATIC program",
+                                     epilog="Use 'flowmatic.py convert SOURCE DESTINATION' to convert data files, "
+                                            "'flowmatic.py batch MANIFEST' to run many programs at once, and "
+                                            "'flowmatic.py pipeline MANIFEST' to stream records between programs.")
+    parser.add_argument("program_file", help="FLOW-MATIC program to run")
+    parser.add_argument("--compile", action="store_true",
+                        help="translate the program to Python before running it")
+    parser.add_argument("--pacing", choices=PACING_MODES, default="realtime",
+                        help="none runs at full speed, realtime sleeps like a UNIVAC II, "
+                             "virtual charges a simulated UNIVAC II clock instead (default: realtime)")
+    parser.add_argument("--input-mode", choices=INPUT_MODES, default="stream",
+                        help="stream reads input files a block at a time; mmap maps them and "
+                             "indexes their lines so REWIND is free; shared parses each once into "
+                             "shared memory that concurrent runs read together (default: stream)")
+    parser.add_argument("--uniservo", action="store_true",
+                        help="read ahead, write behind and rewind each file on a background tape unit, "
+                             "overlapping file input and output with the program")
+    parser.add_argument("--flush-records", type=int, default=FLUSH_RECORDS, metavar="N",
+                        help="records an output file buffers before writing them (default: %(default)s)")
+    parser.add_argument("--flush-bytes", type=int, default=FLUSH_BYTES, metavar="N",
+                        help="bytes an output file buffers before writing them (default: %(default)s)")
+    parser.add_argument("--input-dir", default='', metavar="DIR",
+                        help="read INPUT files from DIR (default: the current directory)")
+    parser.add_argument("--output-dir", default='', metavar="DIR",
+                        help="write output files to DIR (default: the current directory)")
+    parser.add_argument("--sort-records", type=int, default=SORT_RECORDS, metavar="N",
+                        help="records SORT holds in memory at once, sorting longer files in runs "
+                             "merged from temporary files (default: %(default)s)")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, default="summary",
+                        help="silent prints nothing, errors only failures, summary also files and "
+                             "the outcome, trace every step (default: summary)")
+    parser.add_argument("--output-format", choices=list(CODECS), default="text",
+                        help="text writes <name>.dat, tape packed <name>.tape images, csv <name>.csv "
+                             "and jsonl <name>.jsonl, for files no --codec names (default: text)")
+    parser.add_argument("--codec", action="append", default=[], metavar="LETTER=CODEC",
+                        help=f"read or write file LETTER with CODEC, one of {', '.join(CODECS)} "
+                             "(default: by the file's extension)")
+    parser.add_argument("--profile", action="store_true",
+                        help="time and count every operation and branch, then report the hottest and "
+                             "write <program>.profile.json and <program>.folded to the output directory")
+    parser.add_argument("--record-trace", metavar="FILE",
+                        help="record the operations run and the records read into a compact trace FILE")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="run on the records in trace FILE instead of the input files, "
+                             "stopping at the first step that differs from it")
+    parser.add_argument("--no-fuse", action="store_true",
+                        help="run every operation on its own instead of fusing straight-line runs of "
+                             "operations into superinstructions")
+    parser.add_argument("--no-batch", action="store_true",
+                        help="step through read-transform-write loops instead of running them as batches")
+    parser.add_argument("--hash-join", action="store_true",
+                        help="hold files that are rescanned for a matching key in memory, indexed by that key")
+    parser.add_argument("--emit-python", metavar="FILE",
+                        help="write the Python translation of the program to FILE")
+    parser.add_argument("--layout", action="append", default=[], metavar="LETTER=FILE",
+                        help="read input file LETTER as fixed-width records laid out by FILE "
+                             "(default: <name>.layout next to <name>.dat, if present)")
+    args = parser.parse_args()
+    layouts = {}
+    for spec in args.layout:
+        letter, separator, layout_file = spec.partition('=')
+        if not separator or not letter or not layout_file:
+            parser.error(f"--layout expects LETTER=FILE, not {spec}")
+        layouts[letter] = layout_file
+    codecs = {}
+    for spec in args.codec:
+        letter, separator, codec = spec.partition('=')
+        if not separator or not letter or codec not in CODECS:
+            parser.error(f"--codec expects LETTER=CODEC with CODEC one of {', '.join(CODECS)}, not {spec}")
+        codecs[letter] = codec
+    if args.compile and (args.profile or args.record_trace or args.replay):
+        parser.error("--profile, --record-trace and --replay follow the interpreter's steps "
+                     "and cannot be combined with --compile")
+    if args.sort_records < 1:
+        parser.error("--sort-records must be at least 1")
+    if args.input_mode == "shared" and fcntl is None:
+        parser.error("--input-mode shared needs file locks, which this platform lacks")
+    log = Log(args.log_level)
     
     # Get program file path
-    program_file = sys.argv[1]
+    program_file = args.program_file
     
     # Load program from file
     try:
         with open(program_file, 'r') as f:
             program_text = f.read()
-        print(f"Loaded program from {program_file}")
+        log.summary("Loaded program from %s", program_file)
     except Exception as e:
-        print(f"Error loading program: {e}")
+        log.error("Error loading program: %s", e)
         sys.exit(1)
     
+    # Like batch and pipeline jobs, a run creates its output directory
+    if args.output_dir:
+        try:
+            os.makedirs(args.output_dir, exist_ok=True)
+        except OSError as e:
+            log.error("ERROR creating output directory %s: %s", args.output_dir, e)
+            sys.exit(1)
+    
     # Create interpreter and run program
-    interpreter = FlowmaticInterpreter()
+    interpreter = FlowmaticInterpreter(log)
+    interpreter.pacing = args.pacing
+    interpreter.file_handler.input_mode = args.input_mode
+    interpreter.file_handler.uniservo = args.uniservo
+    interpreter.file_handler.flush_records = args.flush_records
+    interpreter.file_handler.flush_bytes = args.flush_bytes
+    interpreter.file_handler.sort_records = args.sort_records
+    interpreter.file_handler.input_directory = args.input_dir
+    interpreter.file_handler.output_directory = args.output_dir
+    interpreter.file_handler.layouts = layouts
+    interpreter.file_handler.output_format = args.output_format
+    interpreter.file_handler.codecs = codecs
+    interpreter.superinstructions = not args.no_fuse
+    interpreter.batching = not args.no_batch
+    interpreter.hash_joins = args.hash_join
     interpreter.parse_program(program_text)
-    interpreter.execute()
+    
+    if args.emit_python:
+        with open(args.emit_python, 'w') as f:
+            f.write(FlowmaticCompiler(interpreter).generate())
+        log.summary("Wrote Python translation: %s", args.emit_python)
+    
+    if args.profile:
+        interpreter.profiler = Profiler()
+    try:
+        if args.record_trace:
+            interpreter.recorder = TraceRecorder(args.record_trace)
+        if args.replay:
+            interpreter.replay = TraceReplayer(args.replay)
+    except Exception as e:
+        log.error("ERROR opening trace: %s", e)
+        sys.exit(1)
+    
+    if args.compile:
+        interpreter.execute_compiled()
+    else:
+        interpreter.execute()
+    report_run(interpreter)
+    
+    if args.profile:
+        # Next to the output files, so running a program never writes into its source directory
+        base_name = os.path.join(args.output_dir, os.path.splitext(os.path.basename(program_file))[0])
+        profiler = interpreter.profiler
+        profiler.report(log)
+        try:
+            profiler.save(f"{base_name}.profile.json", f"{base_name}.folded", os.path.basename(base_name))
+            log.summary("Wrote profile: %s.profile.json, %s.folded", base_name, base_name)
+        except OSError as e:
+            log.error("ERROR writing profile: %s", e)